@@ -0,0 +1,150 @@
+import decimal
+from datetime import timedelta
+from fractions import Fraction
+from typing import List, Union
+
+try:
+    import numpy
+except ImportError:  # optional, allocate() falls back to Python ints
+    numpy = None
+
+__all__ = 'SCALE', 'ONE', 'to_fixed', 'to_decimal', 'mul', 'div', 'mul_div', 'round_down', 'power', 'microseconds', 'allocate',
+
+SCALE = 18
+ONE = 10 ** SCALE  # amounts are ints in units of 10^-18, the precision of FixedDecimalField
+EXACT = decimal.Context(prec=100)  # conversions must not round at the default 28 digits
+
+
+def to_fixed(value: Union[decimal.Decimal, int, str]) -> int:
+    """
+    Decimal amount to fixed-point int, digits beyond 18 places are dropped
+    """
+    with decimal.localcontext(EXACT):
+        return int(decimal.Decimal(value).scaleb(SCALE).to_integral_value(rounding=decimal.ROUND_DOWN))
+
+
+def to_decimal(value: int) -> decimal.Decimal:
+    """
+    Fixed-point int to Decimal with 18 places, exact regardless of decimal context precision
+    """
+    with decimal.localcontext(EXACT):
+        return decimal.Decimal(value).scaleb(-SCALE)
+
+
+def _div(numerator: int, denominator: int) -> int:
+    # Rounds toward zero, like round_down
+    quotient = abs(numerator) // abs(denominator)
+    return quotient if (numerator < 0) == (denominator < 0) else -quotient
+
+
+def mul(a: int, b: int) -> int:
+    return _div(a * b, ONE)
+
+
+def div(a: int, b: int) -> int:
+    return _div(a * ONE, b)
+
+
+def mul_div(a: int, b: int, c: int) -> int:
+    """
+    a * b / c with a single rounding, b and c may be plain ints (e.g. microseconds)
+    """
+    return _div(a * b, c)
+
+
+def round_down(value: int, places: int) -> int:
+    """
+    Drop digits beyond `places` decimal places, same as common round_down on Decimal
+    """
+    if places >= SCALE:
+        return value
+    unit = 10 ** (SCALE - places)
+    return _div(value, unit) * unit
+
+
+def power(base: int, exponent: int) -> int:
+    result = ONE
+    for _ in range(exponent):
+        result = mul(result, base)
+    return result
+
+
+def microseconds(duration: timedelta) -> int:
+    return duration // timedelta(microseconds=1)
+
+
+LIMB_BITS = 16  # allocate() splits big ints into base 2^16 digits, so products of digits fit into int64
+
+
+def _to_limbs(values: List[int], count: int) -> 'numpy.ndarray':
+    """
+    Non-negative ints as a (len(values), count) int64 matrix of base 2^16 digits, least significant first
+    """
+    width = count * LIMB_BITS // 8
+    raw = b''.join(value.to_bytes(width, 'little') for value in values)
+    return numpy.frombuffer(raw, dtype='<u2').reshape(len(values), count).astype(numpy.int64)
+
+
+def _from_limbs(matrix: 'numpy.ndarray') -> List[int]:
+    # Digits of every row must already be carried below 2^16
+    raw = matrix.astype('<u2').tobytes()
+    width = matrix.shape[1] * LIMB_BITS // 8
+    return [int.from_bytes(raw[offset:offset + width], 'little') for offset in range(0, len(raw), width)]
+
+
+def _allocate_limbs(shares: List[int], numerator: int, denominator: int) -> List[int]:
+    """
+    share * numerator // denominator of non-negative ints of any size, in int64 NumPy arithmetic.
+
+    With share digits s_i and B^i * numerator = Q_i * denominator + R_i the result is
+    sum(s_i * Q_i) + (sum(s_i * R_i) // denominator). The first sum is computed on base 2^16 digits of Q_i.
+    The second is below the sum of digits, it is estimated from R_i / denominator with
+    `fraction_bits` bits, which is exact unless the fractional part of the estimate is within the
+    sum of digits of the next integer; such rare rows are recomputed with Python ints.
+    """
+    count = max(1, -(-max(shares).bit_length() // LIMB_BITS))
+    fraction_bits = 62 - LIMB_BITS - count.bit_length()
+    digits = _to_limbs(shares, count)
+
+    quotients, fractions = [], []
+    for i in range(count):
+        quotient, remainder = divmod(numerator << (LIMB_BITS * i), denominator)
+        quotients.append(quotient)
+        fractions.append((remainder << fraction_bits) // denominator)
+
+    quotient_count = max(1, -(-max(quotients).bit_length() // LIMB_BITS))
+    quotient_digits = _to_limbs(quotients, quotient_count)
+    amounts = numpy.zeros((len(shares), quotient_count + 2), dtype=numpy.int64)
+    for i in range(count):
+        amounts[:, :quotient_count] += digits[:, i:i + 1] * quotient_digits[i]
+
+    estimate = digits @ numpy.array(fractions, dtype=numpy.int64)
+    amounts[:, 0] += estimate >> fraction_bits
+    exact = (estimate & ((1 << fraction_bits) - 1)) + digits.sum(axis=1) <= 1 << fraction_bits
+
+    for i in range(amounts.shape[1] - 1):
+        amounts[:, i + 1] += amounts[:, i] >> LIMB_BITS
+        amounts[:, i] &= (1 << LIMB_BITS) - 1
+    return [amount if is_exact else share * numerator // denominator for share, amount, is_exact in zip(shares, _from_limbs(amounts), exact.tolist())]
+
+
+def allocate(shares: List[int], numerator: int, denominator: int, places: int = SCALE) -> List[int]:
+    """
+    share * numerator / denominator for every share, rounded down to `places`.
+    Same result as round_down(mul_div(share, numerator, denominator), places) per share.
+
+    Amounts are far beyond int64 (10 tokens are 10^19 units), so with NumPy the vector is
+    computed on base 2^16 digits by _allocate_limbs, otherwise with exact Python ints.
+    """
+    if not shares:
+        return []
+    unit = 10 ** (SCALE - places) if places < SCALE else 1
+    sign = -1 if (numerator < 0) != (denominator < 0) else 1
+    # Rounding toward zero twice equals rounding once by denominator * unit
+    ratio = Fraction(abs(numerator), abs(denominator) * unit)
+    magnitudes = [abs(share) for share in shares]
+    if numpy is not None:
+        amounts = _allocate_limbs(magnitudes, ratio.numerator, ratio.denominator)
+    else:
+        amounts = [share * ratio.numerator // ratio.denominator for share in magnitudes]
+    return [amount * unit * (sign if share >= 0 else -sign) for share, amount in zip(shares, amounts)]
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+__all__ = 'LatencyReservoir', 'treasury_latency', 'treasury_call',
+
+
+class LatencyReservoir:
+    """
+    Latest durations of every operation kept in process memory, for latency percentiles in metrics.
+    Every process has its own reservoir and reports only the calls it made.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+
+    def observe(self, operation: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(operation, deque(maxlen=self.size)).append(seconds)
+            count, total = self._totals.get(operation, (0, 0.0))
+            self._totals[operation] = (count + 1, total + seconds)
+
+    def summary(self, quantiles: List[float]) -> Dict[str, Tuple[Dict[float, float], int, float]]:
+        """
+        :return: operation to (quantile to seconds over the kept samples, count of all calls, sum of all calls)
+        """
+        with self._lock:
+            samples = {operation: sorted(values) for operation, values in self._samples.items()}
+            totals = dict(self._totals)
+        result = {}
+        for operation, values in samples.items():
+            # Nearest rank
+            percentiles = {quantile: values[min(len(values) - 1, int(quantile * len(values)))] for quantile in quantiles}
+            result[operation] = (percentiles, *totals[operation])
+        return result
+
+
+treasury_latency = LatencyReservoir()
+
+
+@contextmanager
+def treasury_call(operation: str):
+    """
+    Measure a Treasury API call, failed calls included
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        treasury_latency.observe(operation, time.monotonic() - started)
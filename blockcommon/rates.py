@@ -0,0 +1,76 @@
+import decimal
+import threading
+import time
+from datetime import datetime
+from typing import Dict
+
+from django.conf import settings
+from django.utils import timezone
+
+from exchange.models import Currency
+
+__all__ = 'RateSnapshot', 'CurrencyRates', 'currency_rates',
+
+DEFAULT_TTL = 5  # seconds
+
+
+class RateSnapshot:
+    """
+    USD rates of all currencies read at one moment
+    """
+
+    def __init__(self, rates: Dict[int, decimal.Decimal], taken_at: datetime):
+        self.rates = rates
+        self.taken_at = taken_at
+
+    def usd_rate(self, currency_id) -> decimal.Decimal:
+        return self.rates[currency_id]
+
+
+class CurrencyRates:
+    """
+    Process-local snapshot of exchange.Currency.usd_rate shared by APY and sale math.
+
+    The snapshot is reloaded after settings.CURRENCY_RATE_TTL seconds, or on the next read after
+    a Currency is saved in this process. Other processes see a saved rate within the TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._expires = 0.0
+
+    def snapshot(self) -> RateSnapshot:
+        with self._lock:
+            if self._snapshot is None or time.monotonic() >= self._expires:
+                self._snapshot = self._load()
+                self._expires = time.monotonic() + getattr(settings, 'CURRENCY_RATE_TTL', DEFAULT_TTL)
+            return self._snapshot
+
+    def snapshot_for(self, *currency_ids) -> RateSnapshot:
+        """
+        :return: current snapshot, reloaded once if it does not know one of the currencies (created since it was taken)
+        """
+        snapshot = self.snapshot()
+        if any(currency_id not in snapshot.rates for currency_id in currency_ids):
+            self.invalidate()
+            snapshot = self.snapshot()
+        return snapshot
+
+    def usd_rate(self, currency_id) -> decimal.Decimal:
+        """
+        :return: USD rate of currency from the current snapshot, reloaded once for a currency it does not know
+        """
+        return self.snapshot_for(currency_id).usd_rate(currency_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    @staticmethod
+    def _load() -> RateSnapshot:
+        taken_at = timezone.now()
+        return RateSnapshot({currency.id: currency.usd_rate for currency in Currency.objects.all()}, taken_at)
+
+
+currency_rates = CurrencyRates()
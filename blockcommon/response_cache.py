@@ -0,0 +1,105 @@
+import hashlib
+import time
+import uuid
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+__all__ = 'ProgramResponseCacheMixin', 'invalidate_program_responses', 'invalidate_related_program_responses',
+
+PREFIX = 'program-response'
+DEFAULT_TTL = 60  # seconds, safety net for changes which send no signal
+LOCK_TIMEOUT = 5  # seconds a miss waits for the request computing the same response
+POLL_INTERVAL = 0.05
+
+
+def version_key(app_label: str, program_id=None) -> str:
+    return f'{PREFIX}:{app_label}:{program_id or "list"}:version'
+
+
+def invalidate_program_responses(app_label: str, program_id=None):
+    """
+    Drop cached responses of program and of the program list of the app. Responses are not
+    deleted, their version changes: now, and again when the current database transaction
+    commits, so a response computed from data read before the commit is not served afterwards.
+    """
+    def bump():
+        cache.set_many({version_key(app_label): uuid.uuid4().hex, version_key(app_label, program_id): uuid.uuid4().hex}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_related_program_responses(app_label: str, instance, action: str, reverse: bool, pk_set):
+    """
+    m2m_changed of a Program relation (links, agreements): invalidate every program it touches.
+    From the related side programs are found before a clear, as pk_set is empty then.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        program_ids = [instance.pk]
+    elif action == 'pre_clear':
+        program_ids = list(instance.program_set.values_list('id', flat=True))
+    else:
+        program_ids = pk_set
+    for program_id in program_ids:
+        invalidate_program_responses(app_label, program_id)
+
+
+def cached_response(key: str, compute: Callable[[], Response]) -> Response:
+    """
+    Response data from cache, or computed by one request at a time: concurrent misses of the same
+    key wait for the first one instead of hitting the database, and compute it themselves only
+    if it does not finish within LOCK_TIMEOUT.
+    """
+    data = cache.get(key)
+    if data is not None:
+        return Response(data)
+
+    lock = f'{key}:lock'
+    acquired = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not acquired:
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+    try:
+        response = compute()
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'PROGRAM_RESPONSE_CACHE_TTL', DEFAULT_TTL))
+        return response
+    finally:
+        if acquired:
+            cache.delete(lock)
+
+
+class ProgramResponseCacheMixin:
+    """
+    Server-side cache of a public program endpoint, keyed by app, endpoint, program, staff-ness
+    and query string. Serialized data is cached, so every request is still rendered in the format
+    it asks for. Responses are invalidated by invalidate_program_responses.
+
+    With cache_authenticated False only anonymous requests are cached, for serializers which
+    contain data of the requesting user.
+    """
+    cache_endpoint = None
+    cache_authenticated = True
+
+    def get(self, request, *args, **kwargs):
+        if not self.cache_authenticated and request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        app_label = self.queryset.model._meta.app_label
+        program_id: Optional[str] = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        version = cache.get(version_key(app_label, program_id)) or '0'
+        query = hashlib.md5(urlencode(sorted((name, value) for name, value in request.query_params.items() if name != 'format')).encode()).hexdigest()
+        key = f'{PREFIX}:{app_label}:{self.cache_endpoint}:{program_id or "-"}:{int(request.user.is_staff)}:{version}:{query}'
+        return cached_response(key, lambda: super(ProgramResponseCacheMixin, self).get(request, *args, **kwargs))
@@ -5,3 +5,10 @@ from .reward import *
 from .wallet import *
 from .claim_reward import *
 from .program_link import *
+from .stake_checkpoint import *
+from .stake_snapshot import *
+from .reward_run import *
+from .deposit_discrepancy import *
+from .reconciliation_mark import *
+from .treasury_balance_check import *
+from .program_stats import *
@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from blockfarm.models import DepositDiscrepancy
+
+__all__ = 'DepositDiscrepancyAdmin',
+
+
+@admin.register(DepositDiscrepancy)
+class DepositDiscrepancyAdmin(admin.ModelAdmin):
+    list_filter = [
+        'program',
+    ]
+
+    def get_list_display(self, request):
+        return [f.name for f in self.model._meta.fields]
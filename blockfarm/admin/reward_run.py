@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from blockfarm.models import RewardRun
+
+__all__ = 'RewardRunAdmin',
+
+
+@admin.register(RewardRun)
+class RewardRunAdmin(admin.ModelAdmin):
+    list_filter = [
+        'program',
+    ]
+
+    def get_list_display(self, request):
+        return [f.name for f in self.model._meta.fields]
@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from blockfarm.models import TreasuryBalanceCheck
+
+__all__ = 'TreasuryBalanceCheckAdmin',
+
+
+@admin.register(TreasuryBalanceCheck)
+class TreasuryBalanceCheckAdmin(admin.ModelAdmin):
+    list_filter = [
+        'status',
+    ]
+
+    def get_list_display(self, request):
+        return [f.name for f in self.model._meta.fields]
@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 
 
 class BlockfarmConfig(AppConfig):
@@ -12,8 +12,24 @@ class BlockfarmConfig(AppConfig):
         from blockfarm.models import ClaimReward
         from blockfarm.models import Program
         from blockfarm.models import Reward
+        from blockfarm.models import Account
+        from blockfarm.models import ProgramLink
+        from blockfarm.models import ProgramStats
+        from exchange.models import Currency
 
         post_save.connect(blockfarm.signals.push_transaction, sender=Transaction, dispatch_uid='push_transaction')
         post_save.connect(blockfarm.signals.push_claim_reward, sender=ClaimReward, dispatch_uid='push_claim_reward')
         post_save.connect(blockfarm.signals.create_program_accounts, sender=Program, dispatch_uid='create_program_accounts')
+        pre_save.connect(blockfarm.signals.start_reward_index, sender=Program, dispatch_uid='start_reward_index')
         post_save.connect(blockfarm.signals.push_reward, sender=Reward, dispatch_uid='push_reward')
+        post_save.connect(blockfarm.signals.invalidate_currency_rates, sender=Currency, dispatch_uid='invalidate_currency_rates')
+
+        # Cached responses of the public program endpoints
+        for signal in (post_save, post_delete):
+            signal.connect(blockfarm.signals.invalidate_program, sender=Program, dispatch_uid='invalidate_program')
+            signal.connect(blockfarm.signals.invalidate_program_of, sender=ProgramStats, dispatch_uid='invalidate_program_of_stats')
+        post_save.connect(blockfarm.signals.refresh_program_stats, sender=Account, dispatch_uid='refresh_program_stats')
+        post_delete.connect(blockfarm.signals.invalidate_program_of, sender=Account, dispatch_uid='invalidate_program_of_account')
+        post_save.connect(blockfarm.signals.invalidate_programs_of_link, sender=ProgramLink, dispatch_uid='invalidate_programs_of_link')
+        pre_delete.connect(blockfarm.signals.invalidate_programs_of_link, sender=ProgramLink, dispatch_uid='invalidate_programs_of_link')
+        m2m_changed.connect(blockfarm.signals.invalidate_program_links, sender=Program.links.through, dispatch_uid='invalidate_program_links')
@@ -0,0 +1,163 @@
+from datetime import datetime
+
+from django.db import connection
+
+from blockcommon import fixedpoint
+from .models import Program, ProgramStats, Transaction, Reward, Wallet, StakeSnapshot
+
+__all__ = 'reward_iteration',
+
+# Text of a timestamp in reward ids, the same as rewards.REWARD_ID_TIME_FORMAT
+REWARD_ID_TIME = "to_char({} AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US')"
+
+USER_CHANGES = """
+    user_changes AS (
+        SELECT wallet.user_id, tx.created_at, SUM(CASE WHEN tx.type = %(stake)s THEN tx.amount ELSE -tx.amount END) AS amount
+        FROM {transaction} tx JOIN {wallet} wallet ON wallet.id = tx.wallet_id
+        WHERE tx.program_id = %(program)s AND tx.status = %(success)s AND tx.created_at < %(end)s
+          AND (NOT %(from_snapshot)s OR tx.created_at >= %(start)s)
+        GROUP BY wallet.user_id, tx.created_at
+        UNION ALL
+        SELECT user_id, '-infinity'::timestamptz, balance FROM {snapshot}
+        WHERE %(from_snapshot)s AND program_id = %(program)s AND created_at = %(start)s AND user_id IS NOT NULL
+    )
+"""
+
+STAKES = USER_CHANGES + """,
+    user_stakes AS (
+        SELECT user_id, SUM(amount) OVER (PARTITION BY user_id ORDER BY created_at) AS staked,
+               created_at AS valid_from, LEAD(created_at, 1, 'infinity') OVER (PARTITION BY user_id ORDER BY created_at) AS valid_to
+        FROM user_changes
+    ),
+    total_changes AS (
+        SELECT created_at, SUM(amount) AS amount FROM user_changes GROUP BY created_at
+    ),
+    total_stakes AS (
+        SELECT SUM(amount) OVER (ORDER BY created_at) AS staked,
+               created_at AS valid_from, LEAD(created_at, 1, 'infinity') OVER (ORDER BY created_at) AS valid_to
+        FROM total_changes
+    )
+"""
+
+REWARDS = """
+    WITH boundaries AS (
+        SELECT created_at AS moment FROM {transaction}
+        WHERE program_id = %(program)s AND status = %(success)s AND created_at >= %(start)s AND created_at < %(end)s
+        UNION SELECT %(start)s
+    ),
+    intervals AS (
+        SELECT moment AS started_at, LEAD(moment, 1, %(end)s) OVER (ORDER BY moment) AS ended_at FROM boundaries
+    ),
+    """ + STAKES + """,
+    rewards AS (
+        SELECT user_stakes.user_id, intervals.started_at, intervals.ended_at, user_stakes.staked AS user_staked, total_stakes.staked AS total_staked,
+               trunc(div(user_stakes.staked * %(balance)s * round(EXTRACT(EPOCH FROM intervals.ended_at - intervals.started_at) * 1000000)::numeric,
+                         total_stakes.staked * %(emit_microseconds)s) * %(unit)s,
+                     CASE WHEN intervals.ended_at = %(end)s THEN %(scale)s ELSE 18 END) AS amount
+        FROM intervals
+        JOIN total_stakes ON total_stakes.valid_from <= intervals.started_at AND intervals.started_at < total_stakes.valid_to
+        JOIN user_stakes ON user_stakes.valid_from <= intervals.started_at AND intervals.started_at < user_stakes.valid_to
+        WHERE intervals.ended_at > intervals.started_at AND total_stakes.staked <> 0 AND user_stakes.staked <> 0
+    ),
+    inserted AS (
+        INSERT INTO {reward} (id, user_id, program_id, currency_id, amount, user_staked, total_staked, duration, description, created_at)
+        SELECT md5(%(program)s::text || ':' || user_id::text || ':' || """ + REWARD_ID_TIME.format('started_at') + """ || ':' || """ + REWARD_ID_TIME.format('ended_at') + """)::uuid, user_id, %(program)s, %(currency)s, amount, user_staked, total_staked, ended_at - started_at,
+               'Rewarded ' || amount || ' ' || %(reward_code)s || ' with staked ' || user_staked || '/' || total_staked || ' ' || %(transaction_code)s || ' from ' || started_at || ' to ' || ended_at,
+               now()
+        FROM rewards
+        ON CONFLICT (id) DO NOTHING
+        RETURNING user_id, amount, total_staked
+    )
+    UPDATE {wallet} SET balance = {wallet}.balance + credited.amount
+    FROM (SELECT user_id, SUM(amount) AS amount, COUNT(*) AS rewards, MAX(total_staked) AS total_staked FROM inserted GROUP BY user_id) credited
+    WHERE {wallet}.user_id = credited.user_id AND {wallet}.program_id = %(program)s AND {wallet}.type = %(reward_wallet)s
+    RETURNING credited.rewards, credited.total_staked
+"""
+
+SNAPSHOT = """
+    WITH """ + USER_CHANGES + """
+    INSERT INTO {snapshot} (program_id, user_id, created_at, balance)
+    SELECT %(program)s, user_id, %(end)s, SUM(amount) FROM user_changes GROUP BY user_id HAVING SUM(amount) <> 0
+    UNION ALL
+    SELECT %(program)s, NULL, %(end)s, COALESCE(SUM(amount), 0) FROM user_changes
+"""
+
+
+def format_tables(sql: str) -> str:
+    return sql.format(transaction=Transaction._meta.db_table, wallet=Wallet._meta.db_table, reward=Reward._meta.db_table, snapshot=StakeSnapshot._meta.db_table)
+
+
+def create_reward_wallets(params: dict):
+    """
+    Make sure every user staking in the iteration has a REWARD wallet, in one INSERT ... SELECT
+    """
+    columns, values, params = [], [], dict(params)
+    for field in Wallet._meta.concrete_fields:
+        columns.append(field.column)
+        if field.primary_key:
+            values.append('md5(random()::text || clock_timestamp()::text || users.user_id::text)::uuid')
+        elif field.name == 'type':
+            values.append('%(reward_wallet)s')
+        elif field.name == 'user':
+            values.append('users.user_id')
+        elif field.name == 'program':
+            values.append('%(program)s')
+        else:
+            values.append(f'%(default_{field.column})s')
+            params[f'default_{field.column}'] = field.get_db_prep_save(field.get_default(), connection)
+
+    sql = "WITH " + format_tables(USER_CHANGES) + f"""
+        INSERT INTO {Wallet._meta.db_table} ({', '.join(columns)})
+        SELECT {', '.join(values)} FROM (SELECT DISTINCT user_id FROM user_changes) users
+        ON CONFLICT DO NOTHING
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def reward_iteration(program: Program, start_time: datetime, end_time: datetime, reward_balance: int) -> int:
+    """
+    Reward iteration [start_time, end_time) of program inside PostgreSQL.
+
+    Running stakes per user and per program come from SUM() OVER windows, interval lengths from
+    LEAD() over the transaction timestamps of the iteration, and all Reward rows are written by one
+    INSERT ... SELECT which also credits REWARD wallets. History is read from the stake snapshot
+    at start_time when there is one, and the snapshot at end_time is written by the same call,
+    which also prunes snapshots beyond the retention window.
+    Amounts match the Python engine: the fixed-point reward balance is divided exactly with div(),
+    which truncates, then rounded down to 18 places inside the iteration and to custodian scale
+    for the closing interval. Reward ids are derived from program, user and interval like
+    rewards.reward_id, so a replayed iteration, by either engine, neither duplicates rewards nor
+    credits them twice. ProgramStats.max_staked is raised to the largest total stake of the
+    written rewards.
+    Must be called inside transaction.atomic().
+
+    :return: amount of written rewards
+    """
+    params = {
+        'program': program.pk,
+        'success': Transaction.Status.SUCCESS,
+        'stake': Transaction.Type.STAKE,
+        'start': start_time,
+        'end': end_time,
+        'balance': reward_balance,
+        'emit_microseconds': fixedpoint.microseconds(program.emit_duration),
+        'unit': fixedpoint.to_decimal(1),
+        'scale': program.reward_currency.custodian_scale,
+        'currency': program.reward_currency_id,
+        'reward_code': program.reward_currency.code,
+        'transaction_code': program.transaction_currency.code,
+        'reward_wallet': Wallet.Type.REWARD,
+        'from_snapshot': StakeSnapshot.objects.filter(program=program, user=None, created_at=start_time).exists(),
+    }
+    create_reward_wallets(params)
+    StakeSnapshot.objects.filter(program=program, created_at=end_time).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(format_tables(REWARDS), params)
+        credited = cursor.fetchall()
+        cursor.execute(format_tables(SNAPSHOT), params)
+    # After the snapshot at start_time was read
+    StakeSnapshot.prune(program.pk, end_time)
+    if credited:
+        ProgramStats.raise_max_staked(program.pk, max(total_staked for _, total_staked in credited))
+    return sum(rewards for rewards, _ in credited)
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from blockfarm.models import Program, ProgramStats
+
+
+class Command(BaseCommand):
+    help = 'Raise max participants and max staked of programs to the values found in their history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('program_ids', nargs='*', type=str)
+
+    def handle(self, *args, **options):
+        programs = Program.objects.all()
+        if options['program_ids']:
+            programs = programs.filter(id__in=options['program_ids'])
+
+        for program_id in programs.values_list('id', flat=True):
+            with transaction.atomic():
+                stats, created = ProgramStats.objects.select_for_update().get_or_create(program_id=program_id)
+                stats.backfill_counters()
+                stats.save()
+                stats = ProgramStats.refresh(program_id)
+            self.stdout.write(f'Program {program_id}: {stats.max_participants} max participants, {stats.max_staked} max staked')
@@ -1,13 +1,84 @@
-from django.core.management import BaseCommand
+import multiprocessing
+import uuid
 
-from blockfarm.tasks import calculating_rewards
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from blockfarm.models import Program
+from blockfarm.tasks import calculating_program_rewards, reward_arguments, summarize_rewards
+
+
+def reward_program(args):
+    # Runs in a forked worker, which opens its own database connection
+    try:
+        return calculating_program_rewards(*args)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
     help = 'Force create rewards'
 
-    # def add_arguments(self, parser):
-    #     parser.add_argument('program_ids', nargs='*', type=str)
+    def add_arguments(self, parser):
+        parser.add_argument('programs', nargs='*', type=str, help='Program ids or slugs, every enabled program by default')
+        parser.add_argument('--catch-up', action='store_true', help='Reward every overdue iteration instead of one')
+        parser.add_argument('--since', type=str, help='Re-run from this iteration boundary (ISO 8601), catches up to --until or now')
+        parser.add_argument('--until', type=str, help='Catch up to this ISO 8601 datetime instead of now')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report rewards without writing them')
+        parser.add_argument('--workers', type=int, default=1, help='Reward programs in this many parallel processes')
+
+    def parse_datetime_option(self, options, name):
+        if not options[name]:
+            return None
+        value = parse_datetime(options[name])
+        if value is None:
+            raise CommandError(f"Invalid --{name} datetime: {options[name]}")
+        return value
+
+    def program_ids(self, programs):
+        """
+        :return: ids of the programs given by id or slug, None for every program
+        """
+        if not programs:
+            return None
+        ids = {}
+        for program in programs:
+            try:
+                ids[program] = str(uuid.UUID(program))
+            except ValueError:
+                pass
+        found = {}
+        for program_id, slug in Program.objects.filter(Q(id__in=ids.values()) | Q(slug__in=programs)).values_list('id', 'slug'):
+            found[str(program_id)] = found[slug] = str(program_id)
+        missing = [program for program in programs if found.get(ids.get(program, program)) is None and program not in found]
+        if missing:
+            raise CommandError(f"Unknown programs: {', '.join(missing)}")
+        return list({found.get(ids.get(program, program)) or found[program] for program in programs})
 
     def handle(self, *args, **options):
-        calculating_rewards()
+        until = self.parse_datetime_option(options, 'until')
+        since = self.parse_datetime_option(options, 'since')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        try:
+            arguments = reward_arguments(self.program_ids(options['programs']), options['catch_up'] or until is not None, until, since, options['dry_run'])
+            if options['workers'] > 1 and len(arguments) > 1:
+                # Forked workers must not share the connection of this process
+                connections.close_all()
+                with multiprocessing.get_context('fork').Pool(min(options['workers'], len(arguments))) as pool:
+                    results = pool.map(reward_program, arguments, chunksize=1)
+            else:
+                results = [calculating_program_rewards(*args) for args in arguments]
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+        for result in summarize_rewards(results):
+            line = f"{result['program']}: {result['iterations']} iterations in {result['duration']:.3f}s"
+            if result['skipped']:
+                line += ', skipped, rewarding is already running'
+            elif result.get('dry_run'):
+                line += f", would write {result['rewards']} rewards for {result['amount']}"
+            self.stdout.write(line)
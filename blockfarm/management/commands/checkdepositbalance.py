@@ -1,10 +1,24 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
 
 from blockfarm.tasks import check_deposit_balance
 
 
 class Command(BaseCommand):
-    help = 'Force create rewards'
+    help = 'Reconcile deposit wallets and accounts with transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--program', action='append', dest='program_ids', help='Program id to reconcile, may be repeated')
+        parser.add_argument('--since', type=str, help='Only wallets with transactions since this ISO 8601 datetime')
+        parser.add_argument('--incremental', action='store_true', help='Continue from the high-water mark of every program')
 
     def handle(self, *args, **options):
-        check_deposit_balance()
+        if options['incremental'] and options['since']:
+            raise CommandError('--since can not be combined with --incremental')
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+        discrepancies = check_deposit_balance(options['program_ids'], since, options['incremental'])
+        self.stdout.write(f'{discrepancies} discrepancies')
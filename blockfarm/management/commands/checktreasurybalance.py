@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from blockfarm.tasks import check_treasury_balance
+
+
+class Command(BaseCommand):
+    help = 'Reconcile Treasury wallets of blockfarm and blockfunder accounts with their balances (user wallets are not checked)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Concurrent Treasury requests')
+        parser.add_argument('--rate', type=float, help='Treasury requests per second')
+
+    def handle(self, *args, **options):
+        failed = check_treasury_balance(options['workers'], options['rate'])
+        self.stdout.write(f'{failed} mismatched or failed Treasury wallets')
@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from blockfarm.models import Program, StakeCheckpoint, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Rebuild stake-seconds checkpoints from transactions history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('program_ids', nargs='*', type=str)
+
+    def handle(self, *args, **options):
+        programs = Program.objects.all()
+        if options['program_ids']:
+            programs = programs.filter(id__in=options['program_ids'])
+
+        for program in programs:
+            latest = {}
+            checkpoints = []
+            transactions = Transaction.objects.filter(program=program, status=Transaction.Status.SUCCESS).order_by('created_at').values_list('created_at', 'type', 'amount', 'wallet__user')
+            for created_at, transaction_type, amount, user_id in transactions:
+                if transaction_type == Transaction.Type.UNSTAKE:
+                    amount = -amount
+                for owner_id in (user_id, None):
+                    previous = latest.get(owner_id)
+                    if previous is None:
+                        checkpoint = StakeCheckpoint(program=program, user_id=owner_id, created_at=created_at, balance=amount, stake_seconds=0)
+                    else:
+                        checkpoint = StakeCheckpoint(program=program, user_id=owner_id, created_at=created_at, balance=previous.balance + amount, stake_seconds=previous.stake_seconds_until(created_at))
+                    latest[owner_id] = checkpoint
+                    checkpoints.append(checkpoint)
+
+            with transaction.atomic():
+                StakeCheckpoint.objects.filter(program=program).delete()
+                StakeCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+            self.stdout.write(f'Program {program.id}: {len(checkpoints)} checkpoints')
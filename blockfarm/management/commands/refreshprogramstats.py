@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from blockfarm.models import Program, ProgramStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored statistics of programs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('program_ids', nargs='*', type=str)
+
+    def handle(self, *args, **options):
+        programs = Program.objects.all()
+        if options['program_ids']:
+            programs = programs.filter(id__in=options['program_ids'])
+
+        for program_id in programs.values_list('id', flat=True):
+            stats = ProgramStats.refresh(program_id)
+            self.stdout.write(f'Program {program_id}: {stats.participants} participants, {stats.total_staked} staked')
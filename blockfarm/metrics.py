@@ -0,0 +1,76 @@
+import threading
+import time
+
+from django.db.models import Count
+from django.utils import timezone
+
+from blockcommon.latency import treasury_latency
+from blockfunder.models import Transaction as FunderTransaction
+from .models import Program, Transaction, RewardRun
+
+__all__ = 'render_metrics', 'cached_metrics',
+
+METRICS_CACHE_SECONDS = 5
+QUANTILES = [0.5, 0.9, 0.99]
+
+_cache_lock = threading.Lock()
+_cache = {'expires': 0.0, 'body': ''}
+
+
+def _gauge(lines, name, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} gauge')
+    for labels, value in samples:
+        lines.append(f'{name}{{{labels}}} {value}')
+
+
+def _status_counts(model):
+    """
+    Transactions still in flight by status. Terminal statuses grow with the whole history,
+    only UNDEFINED and PENDING are counted, from the partial index of open transactions.
+    """
+    names = dict(model.Status.CHOICES)
+    open_statuses = [model.Status.UNDEFINED, model.Status.PENDING]
+    counts = dict(model.objects.filter(status__in=open_statuses).order_by().values_list('status').annotate(count=Count('id')))
+    return [(f'status="{names[status].lower()}"', counts.get(status, 0)) for status in open_statuses]
+
+
+def render_metrics() -> str:
+    """
+    Operational metrics in Prometheus text exposition format
+    """
+    now = timezone.now()
+    lines = []
+
+    programs = Program.objects.filter(is_enable=True, begin_date__lt=now).values_list('id', 'slug', 'last_rewarded', 'begin_date')
+    _gauge(lines, 'blockfarm_reward_lag_seconds', 'Time since the end of the last rewarded iteration.',
+           [(f'program="{program_id}",slug="{slug}"', (now - (last_rewarded or begin_date)).total_seconds()) for program_id, slug, last_rewarded, begin_date in programs])
+
+    runs = RewardRun.objects.filter(status=RewardRun.Status.FINISHED).exclude(duration=None).order_by('program', '-finished_at').distinct('program').values_list('program', 'duration')
+    _gauge(lines, 'blockfarm_reward_run_duration_seconds', 'Wall time of the latest finished reward run.',
+           [(f'program="{program_id}"', duration.total_seconds()) for program_id, duration in runs])
+
+    _gauge(lines, 'blockfarm_transactions', 'Blockfarm transactions in flight by status.', _status_counts(Transaction))
+    _gauge(lines, 'blockfunder_transactions', 'Blockfunder transactions in flight by status.', _status_counts(FunderTransaction))
+
+    lines.append('# HELP treasury_request_duration_seconds Treasury API call latency in this process.')
+    lines.append('# TYPE treasury_request_duration_seconds summary')
+    for operation, (percentiles, count, total) in sorted(treasury_latency.summary(QUANTILES).items()):
+        for quantile, seconds in percentiles.items():
+            lines.append(f'treasury_request_duration_seconds{{operation="{operation}",quantile="{quantile}"}} {seconds}')
+        lines.append(f'treasury_request_duration_seconds_sum{{operation="{operation}"}} {total}')
+        lines.append(f'treasury_request_duration_seconds_count{{operation="{operation}"}} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def cached_metrics() -> str:
+    """
+    render_metrics() cached in process memory, so frequent scrapes cost one set of queries
+    per METRICS_CACHE_SECONDS. The cache is process-local like the latency reservoir it reports.
+    """
+    with _cache_lock:
+        if _cache['expires'] <= time.monotonic():
+            _cache['body'] = render_metrics()
+            _cache['expires'] = time.monotonic() + METRICS_CACHE_SECONDS
+        return _cache['body']
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.23 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0003_auto_20210518_1023'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='program',
+            name='reward_engine',
+            field=models.IntegerField(choices=[(0, 'Reward rows per transaction interval'), (1, 'Reward per token accumulator')], default=0),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='reward_per_token',
+            field=models.DecimalField(decimal_places=36, default=0, help_text='Accumulated reward per staked token', max_digits=72),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='reward_per_token_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='reward_per_token_paid',
+            field=models.DecimalField(decimal_places=36, default=0, help_text='Program reward per token at last settlement of this deposit wallet', max_digits=72),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='reward_settled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
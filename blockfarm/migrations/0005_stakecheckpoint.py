@@ -0,0 +1,35 @@
+# Generated by Django 2.2.23 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import exchange.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blockfarm', '0004_reward_per_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StakeCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('balance', exchange.fields.FixedDecimalField(help_text='Stake from created_at until the next checkpoint')),
+                ('stake_seconds', models.DecimalField(decimal_places=18, help_text='Integral of stake over time up to created_at', max_digits=56)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='blockfarm.Program')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stakecheckpoint',
+            index=models.Index(fields=['program', 'user', 'created_at'], name='stake_checkpoint_lookup'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.23 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0005_stakecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='program',
+            name='reward_engine',
+            field=models.IntegerField(choices=[(0, 'Reward rows per transaction interval'), (1, 'Reward per token accumulator'), (2, 'Reward rows per transaction interval, computed in database')], default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.23 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import exchange.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blockfarm', '0006_program_reward_engine_database'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StakeSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('balance', exchange.fields.FixedDecimalField()),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='blockfarm.Program')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', 'user'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stakesnapshot',
+            index=models.Index(fields=['program', 'created_at'], name='stake_snapshot_lookup'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.23 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0007_stakesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallet',
+            index=models.Index(condition=models.Q(balance__gt=0, type=0), fields=['program'], name='wallet_active_staker'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.23 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0008_wallet_active_staker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RewardRun',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.IntegerField(choices=[(0, 'Running'), (1, 'Finished')], default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('rewarded_from', models.DateTimeField()),
+                ('rewarded_until', models.DateTimeField()),
+                ('iteration_index', models.IntegerField(default=0, help_text='Iterations committed since rewarded_from')),
+                ('cursor_transaction_id', models.UUIDField(blank=True, help_text='Last transaction of the open iteration with rewarded preceding interval', null=True)),
+                ('cursor_created_at', models.DateTimeField(blank=True, null=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='blockfarm.Program')),
+            ],
+            options={
+                'ordering': ['-started_at', '-id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rewardrun',
+            constraint=models.UniqueConstraint(condition=models.Q(status=0), fields=('program',), name='unique_running_reward_run'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.23 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0009_rewardrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rewardrun',
+            name='duration',
+            field=models.DurationField(blank=True, help_text='Wall time spent rewarding, summed over resumed attempts', null=True),
+        ),
+        migrations.AddField(
+            model_name='rewardrun',
+            name='queries',
+            field=models.IntegerField(default=0, help_text='SQL queries executed'),
+        ),
+        migrations.AddField(
+            model_name='rewardrun',
+            name='transactions_scanned',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rewardrun',
+            name='wallets_considered',
+            field=models.IntegerField(default=0, help_text='Stakes settled, summed over intervals'),
+        ),
+        migrations.AddField(
+            model_name='rewardrun',
+            name='rewards_written',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rewardrun',
+            name='lag',
+            field=models.DurationField(blank=True, help_text='How far last_rewarded was behind the clock when the run finished', null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.23 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0010_rewardrun_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(status__in=[0, 1]), fields=['status'], name='blockfarm_transaction_open'),
+        ),
+        migrations.AddIndex(
+            model_name='rewardrun',
+            index=models.Index(fields=['program', '-finished_at'], name='reward_run_latest'),
+        ),
+    ]
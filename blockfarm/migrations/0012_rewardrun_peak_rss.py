@@ -0,0 +1,18 @@
+# Generated by Django 2.2.23 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0011_metrics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rewardrun',
+            name='peak_rss',
+            field=models.BigIntegerField(blank=True, help_text='Largest resident memory of the worker process sampled during the run, in bytes', null=True),
+        ),
+    ]
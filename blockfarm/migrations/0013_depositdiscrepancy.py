@@ -0,0 +1,31 @@
+# Generated by Django 2.2.23 on 2026-10-18 15:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import exchange.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blockfarm', '0012_rewardrun_peak_rss'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositDiscrepancy',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('checked_at', models.DateTimeField(help_text='Start of the reconciliation pass which found it')),
+                ('expected', exchange.fields.FixedDecimalField()),
+                ('actual', exchange.fields.FixedDecimalField()),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='blockfarm.Program')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-checked_at', '-id'],
+            },
+        ),
+    ]
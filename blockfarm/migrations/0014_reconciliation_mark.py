@@ -0,0 +1,38 @@
+# Generated by Django 2.2.23 on 2026-10-18 15:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import exchange.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blockfarm', '0013_depositdiscrepancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationMark',
+            fields=[
+                ('program', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, serialize=False, to='blockfarm.Program')),
+                ('verified_until', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReconciledBalance',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('balance', exchange.fields.FixedDecimalField()),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='blockfarm.Program')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reconciledbalance',
+            constraint=models.UniqueConstraint(fields=('program', 'user'), name='unique_reconciled_balance'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.23 on 2026-10-18 16:00
+
+from django.db import migrations, models
+import exchange.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0014_reconciliation_mark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreasuryBalanceCheck',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('checked_at', models.DateTimeField(help_text='Start of the reconciliation pass')),
+                ('treasury_id', models.IntegerField()),
+                ('accounts', models.TextField(help_text='app:account id of every account with this treasury_id')),
+                ('expected', exchange.fields.FixedDecimalField()),
+                ('actual', exchange.fields.FixedDecimalField(blank=True, null=True)),
+                ('status', models.IntegerField(choices=[(0, 'Match'), (1, 'Mismatch'), (2, 'Treasury request failed')])),
+                ('error', models.CharField(blank=True, max_length=512)),
+            ],
+            options={
+                'ordering': ['-checked_at', 'treasury_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.23 on 2026-10-18 16:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import exchange.fields
+
+
+def create_program_stats(apps, schema_editor):
+    # The current models are used on purpose: statistics need the history backfill and APY math of
+    # ProgramStats and Program, this migration is the last one which changes the tables they read
+    from blockfarm.models import Program, ProgramStats
+
+    for program_id in Program.objects.values_list('id', flat=True):
+        ProgramStats.refresh(program_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfarm', '0015_treasurybalancecheck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramStats',
+            fields=[
+                ('program', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='stats', serialize=False, to='blockfarm.Program')),
+                ('total_staked', exchange.fields.FixedDecimalField(default=0)),
+                ('total_rewards', exchange.fields.FixedDecimalField(default=0)),
+                ('participants', models.IntegerField(default=0)),
+                ('max_participants', models.IntegerField(default=0, help_text='Users who ever staked')),
+                ('max_staked', exchange.fields.FixedDecimalField(default=0, help_text='Largest total stake of a rewarded interval')),
+                ('apy', models.DecimalField(decimal_places=18, default=0, max_digits=36)),
+                ('max_apy', models.DecimalField(decimal_places=18, default=0, max_digits=36)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_program_stats, migrations.RunPython.noop),
+    ]
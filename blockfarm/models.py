@@ -1,20 +1,34 @@
 import decimal
+import logging
+import os
+import time
 from datetime import timedelta
+from typing import Dict, Optional, Tuple
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import validators
 from django.db.models import F, Max, Value, DecimalField
 from django.db.models.functions import Coalesce
-from django.utils.functional import cached_property
+from django.utils import timezone
 
 from common.helpers import TreasuryAPI
+from common.utils.functional import round_down
 from django.db import models, transaction
 from exchange import fields
 import uuid
 
 from exchange.models import MainTrader
 
-__all__ = 'Program', 'Account', 'Transaction', 'Reward', 'ClaimReward', 'ProgramLink', 'Wallet'
+from blockcommon import fixedpoint
+from blockcommon.latency import treasury_call
+from blockcommon.rates import currency_rates
+
+__all__ = 'Program', 'ProgramStats', 'Account', 'Transaction', 'Reward', 'ClaimReward', 'ProgramLink', 'Wallet', 'StakeCheckpoint', 'StakeSnapshot', 'RewardRun', 'DepositDiscrepancy', 'ReconciliationMark', 'ReconciledBalance', 'TreasuryBalanceCheck'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_RETENTION = timedelta(days=7)  # stake snapshots kept for re-runs --since a recent boundary
 
 
 class Account(models.Model):
@@ -47,6 +61,18 @@ class Account(models.Model):
 
 
 class Program(models.Model):
+    class RewardEngine:
+        SWEEP = 0
+        ACCUMULATOR = 1
+        DATABASE = 2
+
+        CHOICES = [
+            (SWEEP, 'Reward rows per transaction interval'),
+            (ACCUMULATOR, 'Reward per token accumulator'),
+            (DATABASE, 'Reward rows per transaction interval, computed in database'),
+        ]
+
+        _default_value, _name = CHOICES[0]
 
     def _end_date(self):
         if self.begin_date and self.emit_duration:
@@ -74,10 +100,32 @@ class Program(models.Model):
     stack_enabled = models.BooleanField(default=False)
     unstack_enabled = models.BooleanField(default=False)
 
+    reward_engine = models.IntegerField(choices=RewardEngine.CHOICES, default=RewardEngine.SWEEP)
+    reward_per_token = models.DecimalField(max_digits=72, decimal_places=36, default=0, help_text="Accumulated reward per staked token")
+    reward_per_token_updated_at = models.DateTimeField(null=True, blank=True)
+
     def create_account(self):
         Account.objects.get_or_create(type=Account.Type.DEPOSIT, program=self, currency=self.transaction_currency)
         Account.objects.get_or_create(type=Account.Type.REWARD, program=self, currency=self.reward_currency)
 
+    @classmethod
+    def with_stats(cls):
+        """
+        Programs with everything ProgramSerializer reads: currencies and ProgramStats joined, links prefetched
+        """
+        return cls.objects.select_related('transaction_currency', 'reward_currency', 'stats').prefetch_related('links')
+
+    @property
+    def statistics(self) -> 'ProgramStats':
+        """
+        Stored statistics of program, read only. Rows are created with the program and by migration
+        0016 for older programs; a missing row reads as zeros until backfillprogramstats repairs it.
+        """
+        try:
+            return self.stats
+        except ProgramStats.DoesNotExist:
+            return ProgramStats(program_id=self.pk)
+
     @property
     def deposit_account(self) -> Account:
         return Account.objects.get(type=Account.Type.DEPOSIT, program=self)
@@ -106,7 +154,7 @@ class Program(models.Model):
 
     @property
     def participants(self) -> int:
-        return self.wallet_set.filter(type=Wallet.Type.DEPOSIT, balance__gt=0).count()
+        return Wallet.active_stakers(self.id).count()
 
     @property
     def apy(self) -> decimal.Decimal:
@@ -115,31 +163,75 @@ class Program(models.Model):
 
         :return: decimal.Decimal as percentage
         """
-        if self.deposit_account.balance * self.transaction_currency.usd_rate == 0:
-            apy = 1000
-        else:
-            apy = pow(1 + ((self.reward_account.balance * self.reward_currency.usd_rate) / (self.deposit_account.balance * self.transaction_currency.usd_rate)) * decimal.Decimal((self.emit_duration / timedelta(days=30))), 12) - 1
-            if apy > 1000:
-                apy = 1000
-        return apy
-
-    @cached_property
-    def max_participants(self):
-        return Transaction.objects.filter(program=self.id).order_by('user').distinct('user').count()
-
-    @cached_property
-    def max_staked(self):
-        return Reward.objects.filter(program=self.id).aggregate(total_staked=Coalesce(Max('total_staked'), Value(0, output_field=DecimalField())))['total_staked']
-
-    @cached_property
-    def max_apy(self):
-        if self.max_staked * self.transaction_currency.usd_rate == 0:
-            apy = 1000
-        else:
-            apy = pow(1 + ((self.reward_account.balance * self.reward_currency.usd_rate) / (self.max_staked * self.transaction_currency.usd_rate)) * decimal.Decimal((self.emit_duration / timedelta(days=30))), 12) - 1
-            if apy > 1000:
-                apy = 1000
-        return apy
+        return self._apy(self.total_staked)
+
+    def accrued_reward_per_token(self, moment) -> decimal.Decimal:
+        """
+        Reward per staked token accumulated up to moment.
+
+        Emission is linear: reward account balance over emit_duration, shared by total staked.
+        Total staked is constant since the last checkpoint, as every stake and unstake checkpoints it.
+
+        :return: decimal.Decimal as reward tokens per staked token
+        """
+        # Before the first checkpoint the sweep may have rewarded the program up to last_rewarded
+        start = self.reward_per_token_updated_at or self.last_rewarded or self.begin_date
+        if start is None or self.emit_duration is None:
+            return self.reward_per_token
+        start = max(start, self.begin_date)
+        end = min(moment, self.end_date)
+        total_staked = self.total_staked
+        if end <= start or not total_staked:
+            return self.reward_per_token
+        emitted = self.reward_account.balance * decimal.Decimal((end - start) // timedelta(microseconds=1)) / decimal.Decimal(self.emit_duration // timedelta(microseconds=1))
+        return self.reward_per_token + emitted / total_staked
+
+    def start_accumulator(self):
+        """
+        Start the reward per token index where swept rewards end, when program switches to ACCUMULATOR,
+        so the history rewarded by the sweep is not paid again. Deposit wallets are settled at the same
+        point of the index. Called before the program is saved.
+        """
+        self.reward_per_token_updated_at = self.last_rewarded or self.begin_date
+        Wallet.objects.filter(program=self.pk, type=Wallet.Type.DEPOSIT).update(reward_per_token_paid=self.reward_per_token, reward_settled_at=self.reward_per_token_updated_at)
+
+    def update_reward_per_token(self, moment) -> decimal.Decimal:
+        """
+        Checkpoint accumulated reward per token, must be called inside transaction.atomic()
+        before total staked changes
+        """
+        program = Program.objects.select_for_update().get(pk=self.pk)
+        if program.reward_per_token_updated_at is None or moment > program.reward_per_token_updated_at:
+            program.reward_per_token = program.accrued_reward_per_token(moment)
+            program.reward_per_token_updated_at = moment
+        program.save(update_fields=['reward_per_token', 'reward_per_token_updated_at'])
+        self.reward_per_token = program.reward_per_token
+        self.reward_per_token_updated_at = program.reward_per_token_updated_at
+        return self.reward_per_token
+
+    @property
+    def max_participants(self) -> int:
+        return self.statistics.max_participants
+
+    @property
+    def max_staked(self) -> decimal.Decimal:
+        return self.statistics.max_staked
+
+    @property
+    def max_apy(self) -> decimal.Decimal:
+        return self.statistics.max_apy
+
+    def _apy(self, staked):
+        rates = currency_rates.snapshot_for(self.transaction_currency_id, self.reward_currency_id)
+        staked_usd = fixedpoint.mul(fixedpoint.to_fixed(staked), fixedpoint.to_fixed(rates.usd_rate(self.transaction_currency_id)))
+        if staked_usd == 0:
+            return 1000
+        reward_usd = fixedpoint.mul(fixedpoint.to_fixed(self.total_rewards), fixedpoint.to_fixed(rates.usd_rate(self.reward_currency_id)))
+        monthly = fixedpoint.mul_div(fixedpoint.div(reward_usd, staked_usd), fixedpoint.microseconds(self.emit_duration), fixedpoint.microseconds(timedelta(days=30)))
+        apy = fixedpoint.power(fixedpoint.ONE + monthly, 12) - fixedpoint.ONE
+        if apy > 1000 * fixedpoint.ONE:
+            return 1000
+        return fixedpoint.to_decimal(apy)
 
     class Meta:
         ordering = [F('begin_date').asc(nulls_last=True)]
@@ -153,6 +245,100 @@ class ProgramLink(models.Model):
     hyperlink = models.CharField(max_length=512)
 
 
+class ProgramStats(models.Model):
+    """
+    Statistics of program served by the public program endpoints, so they do not aggregate
+    transactions and rewards on every request. Stakes and unstakes apply their deltas with F()
+    updates inside the balance transaction, APY follows after commit; reward runs recompute all.
+
+    max_participants and max_staked are high-water marks which only grow: the first stake of a
+    user counts a participant, every rewarded interval raises max_staked to its total stake.
+    """
+    program = models.OneToOneField('Program', models.PROTECT, primary_key=True, related_name='stats')
+    total_staked = fields.FixedDecimalField(default=0)
+    total_rewards = fields.FixedDecimalField(default=0)
+    participants = models.IntegerField(default=0)
+    max_participants = models.IntegerField(default=0, help_text="Users who ever staked")
+    max_staked = fields.FixedDecimalField(default=0, help_text="Largest total stake of a rewarded interval")
+    apy = models.DecimalField(max_digits=36, decimal_places=18, default=0)
+    max_apy = models.DecimalField(max_digits=36, decimal_places=18, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Program stats #{self.program_id}.'
+
+    def backfill_counters(self):
+        """
+        Raise the high-water marks to the values found in the transactions and rewards history.
+        Users of active wallets count too, a stake is marked successful only after its balance commits.
+        """
+        staked = Transaction.objects.filter(program=self.program_id, type=Transaction.Type.STAKE, status=Transaction.Status.SUCCESS).order_by().values('user')
+        participants = staked.union(Wallet.active_stakers(self.program_id).order_by().values('user')).count()
+        max_staked = Reward.objects.filter(program=self.program_id).aggregate(total_staked=Coalesce(Max('total_staked'), Value(0, output_field=DecimalField())))['total_staked']
+        self.max_participants = max(self.max_participants, participants)
+        self.max_staked = max(self.max_staked, max_staked)
+
+    @classmethod
+    def refresh(cls, program_id, new_participant=False) -> 'ProgramStats':
+        """
+        Recompute statistics of program, counting a new participant if asked. The row stays locked
+        until the enclosing transaction commits, so concurrent refreshes of a program are serialized.
+        A row created here is backfilled from history.
+        """
+        with transaction.atomic():
+            stats, created = cls.objects.select_for_update().get_or_create(program_id=program_id)
+            if created:
+                stats.backfill_counters()
+            elif new_participant:
+                stats.max_participants += 1
+            program = Program.objects.select_related('transaction_currency', 'reward_currency').get(pk=program_id)
+            stats.total_staked = program.total_staked
+            stats.total_rewards = program.total_rewards
+            stats.participants = program.participants
+            stats.apy = program._apy(stats.total_staked)
+            stats.max_apy = program._apy(stats.max_staked)
+            stats.save()
+        return stats
+
+    @classmethod
+    def apply_stake(cls, program_id, amount, participants=0, new_participant=False):
+        """
+        Apply a signed stake amount and the change of active stakers inside the balance transaction.
+        Only F() updates run there, which can not fail on program data, while APY, which needs
+        currency rates and program settings, is refreshed after commit.
+        """
+        cls.objects.filter(program=program_id).update(total_staked=F('total_staked') + amount, participants=F('participants') + participants, max_participants=F('max_participants') + int(new_participant))
+        transaction.on_commit(lambda: cls.refresh_apy(program_id))
+
+    @classmethod
+    def refresh_apy(cls, program_id):
+        """
+        Recompute APY from the stored totals, or all statistics of a program which has no row yet.
+        Runs after the balance change is committed, so a failure is logged and the values stay
+        until the next refresh.
+        """
+        try:
+            with transaction.atomic():
+                stats = cls.objects.select_for_update().filter(program=program_id).first()
+                if stats is None:
+                    cls.refresh(program_id)
+                    return
+                program = Program.objects.select_related('transaction_currency', 'reward_currency').get(pk=program_id)
+                stats.apy = program._apy(stats.total_staked)
+                stats.max_apy = program._apy(stats.max_staked)
+                stats.save(update_fields=['apy', 'max_apy', 'updated_at'])
+        except Exception:
+            logger.exception(f"APY refresh of program {program_id} failed")
+
+    @classmethod
+    def raise_max_staked(cls, program_id, total_staked):
+        """
+        Raise max_staked to the total stake of a rewarded interval, in one UPDATE.
+        max_apy follows with the next refresh.
+        """
+        cls.objects.filter(program=program_id, max_staked__lt=total_staked).update(max_staked=total_staked)
+
+
 class Wallet(models.Model):
     class Type:
         DEPOSIT = 0
@@ -170,11 +356,46 @@ class Wallet(models.Model):
     user = models.ForeignKey(User, models.PROTECT, null=False, blank=False)
     balance = fields.FixedDecimalField(default=0, validators=[validators.MinValueValidator(limit_value=0)])
     program = models.ForeignKey(Program, models.PROTECT, null=False, blank=False)
+    reward_per_token_paid = models.DecimalField(max_digits=72, decimal_places=36, default=0, help_text="Program reward per token at last settlement of this deposit wallet")
+    reward_settled_at = models.DateTimeField(null=True, blank=True)
 
     def get_wallet(self, currency_code):
         trader = MainTrader.objects.get(user=self.user)
         return trader.get_wallet(currency_code)
 
+    @classmethod
+    def active_stakers(cls, program_id):
+        """
+        DEPOSIT wallets of program with positive balance, served by the partial index wallet_active_staker.
+        Most wallets of a long-lived program are fully unstaked, so this set is much smaller than all wallets.
+        """
+        return cls.objects.filter(program=program_id, type=Wallet.Type.DEPOSIT, balance__gt=0)
+
+    def pending_reward(self, reward_per_token) -> decimal.Decimal:
+        """
+        Reward earned by this deposit wallet since its last settlement
+
+        :return: decimal.Decimal as tokens amount
+        """
+        return round_down(self.balance * (reward_per_token - self.reward_per_token_paid), 18)
+
+    def settle_reward(self, moment):
+        """
+        Move pending reward of this deposit wallet to the REWARD wallet and checkpoint it.
+        Must be called inside transaction.atomic() before the deposit balance changes.
+        """
+        program = self.program
+        reward_per_token = program.update_reward_per_token(moment)
+        wallet = Wallet.objects.select_for_update().get(pk=self.pk)
+        amount = wallet.pending_reward(reward_per_token)
+        if amount > 0:
+            description = f"Rewarded {amount} {program.reward_currency.code} with staked {wallet.balance} {program.transaction_currency.code} from {wallet.reward_settled_at or program.begin_date} to {moment}"
+            Reward.objects.create(user_id=wallet.user_id, currency=program.reward_currency, amount=amount, program=program, user_staked=wallet.balance, total_staked=program.total_staked, duration=moment - (wallet.reward_settled_at or program.begin_date), description=description)
+            ProgramStats.raise_max_staked(program.pk, program.total_staked)
+        Wallet.objects.filter(pk=self.pk).update(reward_per_token_paid=reward_per_token, reward_settled_at=moment)
+        self.reward_per_token_paid = reward_per_token
+        self.reward_settled_at = moment
+
     def __str__(self):
         return f'Wallet #{self.id}, User: {self.user}.'
 
@@ -183,6 +404,10 @@ class Wallet(models.Model):
             models.CheckConstraint(check=models.Q(balance__gte=0), name='balance_gte_0'),
             models.UniqueConstraint(fields=['type', 'user', 'program'], name='unique_wallet')
         ]
+        indexes = [
+            # type=0 is Type.DEPOSIT, the nested class is not visible from Meta
+            models.Index(fields=['program'], name='wallet_active_staker', condition=models.Q(type=0, balance__gt=0)),
+        ]
 
 
 class Transaction(models.Model):
@@ -225,16 +450,32 @@ class Transaction(models.Model):
     rewarded = models.BooleanField(default=False)
 
     def create_transaction(self):
+        accumulator = self.program.reward_engine == Program.RewardEngine.ACCUMULATOR
         if self.type == Transaction.Type.STAKE:
-            TreasuryAPI().treasury_wallet_controller().transfer_to_main(self.wallet.get_wallet(self.program.transaction_currency.code).id, self.account.treasury_id, str(self.amount))
+            with treasury_call('transfer_to_main'):
+                TreasuryAPI().treasury_wallet_controller().transfer_to_main(self.wallet.get_wallet(self.program.transaction_currency.code).id, self.account.treasury_id, str(self.amount))
             with transaction.atomic():
+                if accumulator:
+                    self.wallet.settle_reward(timezone.now())
                 Account.objects.filter(id=self.account_id).update(balance=F("balance") + self.amount)
                 Wallet.objects.filter(id=self.wallet_id).update(balance=F("balance") + self.amount)
+                # Read under the wallet row lock: a checkpoint is written by every stake since checkpoints exist,
+                # a successful transaction by every stake before them
+                first_stake = StakeCheckpoint.latest(self.program_id, self.wallet.user_id) is None and not Transaction.objects.filter(program=self.program_id, user=self.wallet.user_id, type=Transaction.Type.STAKE, status=Transaction.Status.SUCCESS).exclude(id=self.id).exists()
+                StakeCheckpoint.record(self.program_id, self.wallet.user_id, self.amount, timezone.now())
+                balance = Wallet.objects.filter(id=self.wallet_id).values_list('balance', flat=True).get()
+                ProgramStats.apply_stake(self.program_id, self.amount, participants=int(self.amount > 0 and balance == self.amount), new_participant=first_stake)
         elif self.type == Transaction.Type.UNSTAKE:
             with transaction.atomic():
+                if accumulator:
+                    self.wallet.settle_reward(timezone.now())
                 Account.objects.filter(id=self.account_id).update(balance=F("balance") - self.amount)
                 Wallet.objects.filter(id=self.wallet_id).update(balance=F("balance") - self.amount)
-            TreasuryAPI().treasury_wallet_controller().transfer_to_main(self.account.treasury_id, self.wallet.get_wallet(self.program.transaction_currency.code).id, str(self.amount))
+                StakeCheckpoint.record(self.program_id, self.wallet.user_id, -self.amount, timezone.now())
+                balance = Wallet.objects.filter(id=self.wallet_id).values_list('balance', flat=True).get()
+                ProgramStats.apply_stake(self.program_id, -self.amount, participants=-int(self.amount > 0 and balance == 0))
+            with treasury_call('transfer_to_main'):
+                TreasuryAPI().treasury_wallet_controller().transfer_to_main(self.account.treasury_id, self.wallet.get_wallet(self.program.transaction_currency.code).id, str(self.amount))
         else:
             raise NotImplementedError(f'Transaction type {self.type} not implemented')
 
@@ -246,11 +487,357 @@ class Transaction(models.Model):
         constraints = [
             models.CheckConstraint(check=models.Q(amount__gte=0), name='amount_gte_0')
         ]
+        indexes = [
+            # Only transactions still in flight, for the metrics
+            models.Index(fields=['status'], name='blockfarm_transaction_open', condition=models.Q(status__in=[0, 1])),
+        ]
 
     def __str__(self):
         return f'Transaction #{self.id}.'
 
 
+class StakeCheckpoint(models.Model):
+    """
+    Time-weighted stake (stake-seconds) of a user in program, accumulated up to created_at.
+    Checkpoints with empty user hold the total stake of program.
+
+    Integral of stake over [t0, t1) is stake_seconds_at(t1) - stake_seconds_at(t0).
+    Sequential id orders checkpoints recorded at the same moment.
+    """
+    id = models.BigAutoField(primary_key=True)
+    program = models.ForeignKey('Program', models.PROTECT)
+    user = models.ForeignKey(User, models.PROTECT, null=True, blank=True)
+    created_at = models.DateTimeField()
+    balance = fields.FixedDecimalField(help_text="Stake from created_at until the next checkpoint")
+    stake_seconds = models.DecimalField(max_digits=56, decimal_places=18, help_text="Integral of stake over time up to created_at")
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['program', 'user', 'created_at'], name='stake_checkpoint_lookup'),
+        ]
+
+    def __str__(self):
+        return f'Stake checkpoint #{self.id}.'
+
+    def fixed_stake_seconds_until(self, moment) -> int:
+        """
+        :return: stake-seconds up to moment as a fixed-point int, stake × microseconds rounded down once
+        """
+        return fixedpoint.to_fixed(self.stake_seconds) + fixedpoint.mul_div(fixedpoint.to_fixed(self.balance), fixedpoint.microseconds(moment - self.created_at), 10 ** 6)
+
+    def stake_seconds_until(self, moment) -> decimal.Decimal:
+        return fixedpoint.to_decimal(self.fixed_stake_seconds_until(moment))
+
+    @classmethod
+    def latest(cls, program_id, user_id, moment=None):
+        queryset = cls.objects.filter(program=program_id, user=user_id)
+        if moment is not None:
+            queryset = queryset.filter(created_at__lte=moment)
+        return queryset.order_by('-created_at', '-id').first()
+
+    @classmethod
+    def record(cls, program_id, user_id, amount, moment):
+        """
+        Add signed stake amount to user and program total at moment.
+        Must be called inside transaction.atomic() after the wallet and account rows are updated,
+        so that concurrent checkpoints of the same user and program are serialized by row locks.
+        """
+        checkpoints = []
+        for owner_id in (user_id, None):
+            previous = cls.latest(program_id, owner_id)
+            if previous is None:
+                checkpoints.append(cls(program_id=program_id, user_id=owner_id, created_at=moment, balance=amount, stake_seconds=0))
+            else:
+                checkpoints.append(cls(program_id=program_id, user_id=owner_id, created_at=max(moment, previous.created_at), balance=previous.balance + amount, stake_seconds=previous.stake_seconds_until(max(moment, previous.created_at))))
+        cls.objects.bulk_create(checkpoints)
+
+    @classmethod
+    def fixed_stake_seconds_at(cls, program_id, user_id, moment) -> int:
+        checkpoint = cls.latest(program_id, user_id, moment)
+        if checkpoint is None:
+            return 0
+        return checkpoint.fixed_stake_seconds_until(moment)
+
+    @classmethod
+    def stake_seconds_at(cls, program_id, user_id, moment) -> decimal.Decimal:
+        """
+        Stake-seconds of user (or of program total when user_id is None) accumulated up to moment
+        """
+        return fixedpoint.to_decimal(cls.fixed_stake_seconds_at(program_id, user_id, moment))
+
+    @classmethod
+    def share(cls, program_id, user_id, start, end) -> decimal.Decimal:
+        """
+        Time-weighted share of user in the total stake of program over [start, end)
+
+        :return: decimal.Decimal from 0 to 1
+        """
+        total = cls.fixed_stake_seconds_at(program_id, None, end) - cls.fixed_stake_seconds_at(program_id, None, start)
+        if not total:
+            return decimal.Decimal(0)
+        return fixedpoint.to_decimal(fixedpoint.div(cls.fixed_stake_seconds_at(program_id, user_id, end) - cls.fixed_stake_seconds_at(program_id, user_id, start), total))
+
+
+class StakeSnapshot(models.Model):
+    """
+    Stake of a user in program at a reward boundary (program.last_rewarded), written by the reward run.
+    Snapshot with empty user holds the total stake of program and marks the boundary as complete.
+
+    Transaction.created_at is refreshed when the status is saved, so a transaction that becomes
+    SUCCESS after the boundary is never missing from the snapshot: it is read by the next run.
+
+    Boundaries older than settings.STAKE_SNAPSHOT_RETENTION before the latest written one are
+    deleted; a re-run `since` such a boundary aggregates the transaction history instead.
+    """
+    id = models.BigAutoField(primary_key=True)
+    program = models.ForeignKey('Program', models.PROTECT)
+    user = models.ForeignKey(User, models.PROTECT, null=True, blank=True)
+    created_at = models.DateTimeField()
+    balance = fields.FixedDecimalField()
+
+    class Meta:
+        ordering = ['-created_at', 'user']
+        indexes = [
+            models.Index(fields=['program', 'created_at'], name='stake_snapshot_lookup'),
+        ]
+
+    def __str__(self):
+        return f'Stake snapshot #{self.id}.'
+
+    @classmethod
+    def load(cls, program_id, moment) -> Optional[Tuple[Dict[int, int], int]]:
+        """
+        Stakes of program at boundary moment
+
+        :return: fixed-point stakes by user id and total stake, None if there is no snapshot at moment
+        """
+        stakes, total = {}, None
+        for user_id, balance in cls.objects.filter(program=program_id, created_at=moment).values_list('user', 'balance').order_by().iterator(chunk_size=2000):
+            if user_id is None:
+                total = fixedpoint.to_fixed(balance)
+            else:
+                stakes[user_id] = fixedpoint.to_fixed(balance)
+        if total is None:
+            return None
+        return stakes, total
+
+    @classmethod
+    def write(cls, program_id, moment, stakes: Dict[int, int], total: int):
+        """
+        Store fixed-point stakes at boundary moment, replacing an earlier snapshot of a re-run boundary
+        and dropping boundaries beyond the retention window. Users with zero stake are omitted.
+        Must be called inside transaction.atomic(), with the end of the iteration.
+        """
+        cls.objects.filter(program=program_id, created_at=moment).delete()
+        snapshots = [cls(program_id=program_id, user_id=user_id, created_at=moment, balance=fixedpoint.to_decimal(balance)) for user_id, balance in stakes.items() if balance]
+        snapshots.append(cls(program_id=program_id, user_id=None, created_at=moment, balance=fixedpoint.to_decimal(total)))
+        cls.objects.bulk_create(snapshots, batch_size=1000)
+        cls.prune(program_id, moment)
+
+    @classmethod
+    def prune(cls, program_id, moment):
+        """
+        Delete boundaries older than settings.STAKE_SNAPSHOT_RETENTION before moment, the boundary
+        just written by either reward engine. Must be called in the transaction which wrote it.
+        """
+        retention = getattr(settings, 'STAKE_SNAPSHOT_RETENTION', DEFAULT_SNAPSHOT_RETENTION)
+        cls.objects.filter(program=program_id, created_at__lt=moment - retention).delete()
+
+
+def current_rss() -> Optional[int]:
+    """
+    :return: resident memory of this process in bytes now, None where /proc is not available.
+        Unlike ru_maxrss it is not the peak of the whole process lifetime, a worker serves many runs.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RewardRun(models.Model):
+    """
+    Progress of rewarding a program, committed together with the rewards it covers.
+
+    iteration_index counts the iterations committed since rewarded_from; inside the open iteration
+    the cursor points to the last transaction whose preceding interval is already rewarded.
+    A run left RUNNING by a dead worker is resumed by the next run of the program.
+    """
+    class Status:
+        RUNNING = 0
+        FINISHED = 1
+
+        CHOICES = [
+            (RUNNING, 'Running'),
+            (FINISHED, 'Finished'),
+        ]
+
+        _default_value, _name = CHOICES[0]
+
+    id = models.BigAutoField(primary_key=True)
+    program = models.ForeignKey('Program', models.PROTECT)
+    status = models.IntegerField(choices=Status.CHOICES, default=Status.RUNNING)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rewarded_from = models.DateTimeField()
+    rewarded_until = models.DateTimeField()
+    iteration_index = models.IntegerField(default=0, help_text="Iterations committed since rewarded_from")
+    cursor_transaction_id = models.UUIDField(null=True, blank=True, help_text="Last transaction of the open iteration with rewarded preceding interval")
+    cursor_created_at = models.DateTimeField(null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True, help_text="Wall time spent rewarding, summed over resumed attempts")
+    queries = models.IntegerField(default=0, help_text="SQL queries executed")
+    transactions_scanned = models.IntegerField(default=0)
+    wallets_considered = models.IntegerField(default=0, help_text="Stakes settled, summed over intervals")
+    rewards_written = models.IntegerField(default=0)
+    lag = models.DurationField(null=True, blank=True, help_text="How far last_rewarded was behind the clock when the run finished")
+    peak_rss = models.BigIntegerField(null=True, blank=True, help_text="Largest resident memory of the worker process sampled during the run, in bytes")
+
+    TELEMETRY_FIELDS = ['duration', 'queries', 'transactions_scanned', 'wallets_considered', 'rewards_written', 'peak_rss']
+
+    class Meta:
+        ordering = ['-started_at', '-id']
+        constraints = [
+            models.UniqueConstraint(fields=['program'], condition=models.Q(status=0), name='unique_running_reward_run'),
+        ]
+        indexes = [
+            models.Index(fields=['program', '-finished_at'], name='reward_run_latest'),
+        ]
+
+    def __str__(self):
+        return f'Reward run #{self.id}, Program: {self.program}.'
+
+    @classmethod
+    def open(cls, program, start_time, end_time):
+        """
+        Resume the unfinished run of program or start a new one.
+        Must be called under program_reward_lock.
+        """
+        run = cls.objects.filter(program=program, status=cls.Status.RUNNING).first()
+        if run is None:
+            run = cls.objects.create(program=program, rewarded_from=start_time, rewarded_until=end_time)
+        else:
+            if run.rewarded_from + run.iteration_index * program.iteration != start_time:
+                # last_rewarded was moved outside of this run, its cursor is meaningless
+                run.rewarded_from, run.iteration_index = start_time, 0
+                run.cursor_transaction_id = run.cursor_created_at = None
+            run.rewarded_until = end_time
+            run.save()
+        run.attempt_started, run.previous_duration = time.monotonic(), run.duration or timedelta()
+        return run
+
+    def update_duration(self):
+        # Memory is sampled at every commit of the run: each rewarded interval and iteration
+        if hasattr(self, 'attempt_started'):
+            self.duration = self.previous_duration + timedelta(seconds=time.monotonic() - self.attempt_started)
+        rss = current_rss()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def advance(self, transaction_id, created_at):
+        self.cursor_transaction_id, self.cursor_created_at = transaction_id, created_at
+        self.update_duration()
+        self.save(update_fields=['cursor_transaction_id', 'cursor_created_at'] + self.TELEMETRY_FIELDS)
+
+    def complete_iteration(self, count=1):
+        self.iteration_index += count
+        self.cursor_transaction_id = self.cursor_created_at = None
+        self.update_duration()
+        self.save(update_fields=['iteration_index', 'cursor_transaction_id', 'cursor_created_at'] + self.TELEMETRY_FIELDS)
+
+    def finish(self, last_rewarded):
+        self.status = RewardRun.Status.FINISHED
+        self.finished_at = timezone.now()
+        self.lag = self.finished_at - last_rewarded
+        self.update_duration()
+        self.save(update_fields=['status', 'finished_at', 'lag'] + self.TELEMETRY_FIELDS)
+
+
+class DepositDiscrepancy(models.Model):
+    """
+    Mismatch found by deposit reconciliation: a DEPOSIT wallet whose balance differs from the sum of
+    its SUCCESS transactions, or (with empty user) the DEPOSIT account whose balance differs from
+    the sum of the DEPOSIT wallets of program.
+    """
+    id = models.BigAutoField(primary_key=True)
+    checked_at = models.DateTimeField(help_text="Start of the reconciliation pass which found it")
+    program = models.ForeignKey('Program', models.PROTECT)
+    user = models.ForeignKey(User, models.PROTECT, null=True, blank=True)
+    expected = fields.FixedDecimalField()
+    actual = fields.FixedDecimalField()
+
+    class Meta:
+        ordering = ['-checked_at', '-id']
+
+    def __str__(self):
+        return f'Deposit discrepancy #{self.id}, Program: {self.program}.'
+
+
+class ReconciliationMark(models.Model):
+    """
+    High-water mark of incremental deposit reconciliation: SUCCESS transactions created before
+    verified_until are folded into the ReconciledBalance rows of program.
+    """
+    program = models.OneToOneField('Program', models.PROTECT, primary_key=True)
+    verified_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Reconciliation mark, Program: {self.program}.'
+
+
+class ReconciledBalance(models.Model):
+    """
+    Deposit balance of user in program expected from SUCCESS transactions before the reconciliation mark
+    """
+    id = models.BigAutoField(primary_key=True)
+    program = models.ForeignKey('Program', models.PROTECT)
+    user = models.ForeignKey(User, models.PROTECT)
+    balance = fields.FixedDecimalField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['program', 'user'], name='unique_reconciled_balance'),
+        ]
+
+    def __str__(self):
+        return f'Reconciled balance #{self.id}, User: {self.user}.'
+
+
+class TreasuryBalanceCheck(models.Model):
+    """
+    Balance of a Treasury wallet compared with the sum of blockfarm and blockfunder accounts linked to it
+    """
+    class Status:
+        MATCH = 0
+        MISMATCH = 1
+        ERROR = 2
+
+        CHOICES = [
+            (MATCH, 'Match'),
+            (MISMATCH, 'Mismatch'),
+            (ERROR, 'Treasury request failed'),
+        ]
+
+        _default_value, _name = CHOICES[0]
+
+    id = models.BigAutoField(primary_key=True)
+    checked_at = models.DateTimeField(help_text="Start of the reconciliation pass")
+    treasury_id = models.IntegerField()
+    accounts = models.TextField(help_text="app:account id of every account with this treasury_id")
+    expected = fields.FixedDecimalField()
+    actual = fields.FixedDecimalField(null=True, blank=True)
+    status = models.IntegerField(choices=Status.CHOICES)
+    error = models.CharField(max_length=512, blank=True)
+
+    class Meta:
+        ordering = ['-checked_at', 'treasury_id']
+
+    def __str__(self):
+        return f'Treasury balance check #{self.id}, Treasury wallet: {self.treasury_id}.'
+
+
 class Reward(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     user = models.ForeignKey(User, models.PROTECT)
@@ -305,10 +892,15 @@ class ClaimReward(models.Model):
 
     def create_claim_reward(self):
         with transaction.atomic():
+            if self.program.reward_engine == Program.RewardEngine.ACCUMULATOR:
+                # Empty wallets were settled when they were unstaked, nothing is pending for them
+                for deposit_wallet in Wallet.active_stakers(self.program_id).filter(user=self.user_id):
+                    deposit_wallet.settle_reward(timezone.now())
             # Account.objects.filter(id=self.account_id).update(balance=F("balance") - self.amount)
             Wallet.objects.filter(id=self.wallet_id).update(balance=F("balance") - self.amount)
 
-        TreasuryAPI().treasury_wallet_controller().transfer_to_main(self.account.treasury_id, self.wallet.get_wallet(self.currency.code).id, str(self.amount))
+        with treasury_call('transfer_to_main'):
+            TreasuryAPI().treasury_wallet_controller().transfer_to_main(self.account.treasury_id, self.wallet.get_wallet(self.currency.code).id, str(self.amount))
 
         self.status = ClaimReward.Status.SUCCESS
         self.save()
@@ -0,0 +1,141 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Account, Program, Transaction, Wallet, DepositDiscrepancy, ReconciliationMark, ReconciledBalance
+from .rewards import STREAM_CHUNK_SIZE, staked_amount
+
+__all__ = 'reconcile_deposits', 'reconcile_deposits_incremental',
+
+logger = logging.getLogger(__name__)
+
+# Transactions younger than this may still be in flight, the high-water mark stays behind them
+RECONCILIATION_SAFETY_LAG = timedelta(minutes=10)
+
+
+class DiscrepancyReport:
+    def __init__(self):
+        self.checked_at = timezone.now()
+        self.discrepancies = []
+
+    def add(self, program_id, user_id, expected, actual):
+        logger.error(f"Deposit discrepancy in program {program_id}, user {user_id}: expected {expected}, actual {actual}")
+        self.discrepancies.append(DepositDiscrepancy(checked_at=self.checked_at, program_id=program_id, user_id=user_id, expected=expected, actual=actual))
+
+    def check_accounts(self, accounts):
+        """
+        Verify DEPOSIT accounts against the sum of the DEPOSIT wallets of their programs, in one grouped query
+        """
+        wallet_totals = dict(Wallet.objects.filter(type=Wallet.Type.DEPOSIT, program__in=accounts.values('program')).values_list('program').annotate(total=Sum('balance')).order_by())
+        for program_id, balance in accounts.values_list('program', 'balance'):
+            total = wallet_totals.get(program_id) or 0
+            if balance != total:
+                self.add(program_id, None, total, balance)
+
+    def save(self) -> List[DepositDiscrepancy]:
+        DepositDiscrepancy.objects.bulk_create(self.discrepancies, batch_size=STREAM_CHUNK_SIZE)
+        logger.info(f"Deposit reconciliation found {len(self.discrepancies)} discrepancies")
+        return self.discrepancies
+
+
+def reconcile_deposits(program_ids: Optional[List[str]] = None, since: Optional[datetime] = None) -> List[DepositDiscrepancy]:
+    """
+    Verify every DEPOSIT wallet against the signed sum of its SUCCESS transactions, and every
+    DEPOSIT account against the sum of its wallets. Discrepancies are written to DepositDiscrepancy.
+
+    Expected balances come from one GROUP BY (program, user) query, which is merge-joined with the
+    wallets streamed in the same order, so memory does not grow with the number of wallets.
+    With `since` only wallets with a transaction created or updated since then are verified.
+
+    :return: saved discrepancies
+    """
+    report = DiscrepancyReport()
+    transactions = Transaction.objects.filter(status=Transaction.Status.SUCCESS)
+    wallets = Wallet.objects.filter(type=Wallet.Type.DEPOSIT)
+    accounts = Account.objects.filter(type=Account.Type.DEPOSIT)
+    if program_ids is not None:
+        transactions, wallets, accounts = transactions.filter(program__in=program_ids), wallets.filter(program__in=program_ids), accounts.filter(program__in=program_ids)
+    if since is not None:
+        # created_at is refreshed on every save, status changes included
+        touched = Transaction.objects.filter(created_at__gte=since).values('wallet')
+        transactions, wallets = transactions.filter(wallet__in=touched), wallets.filter(id__in=touched)
+
+    expected = transactions.values_list('program', 'wallet__user').annotate(amount=staked_amount()).order_by('program', 'wallet__user').iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+    pending = next(expected, None)
+    for program_id, user_id, balance in wallets.values_list('program', 'user', 'balance').order_by('program', 'user').iterator(chunk_size=STREAM_CHUNK_SIZE):
+        while pending is not None and pending[:2] < (program_id, user_id):
+            # Transactions of a user without DEPOSIT wallet
+            if pending[2]:
+                report.add(pending[0], pending[1], pending[2], 0)
+            pending = next(expected, None)
+        amount = 0
+        if pending is not None and pending[:2] == (program_id, user_id):
+            amount = pending[2]
+            pending = next(expected, None)
+        if balance != amount:
+            report.add(program_id, user_id, amount, balance)
+    while pending is not None:
+        if pending[2]:
+            report.add(pending[0], pending[1], pending[2], 0)
+        pending = next(expected, None)
+
+    report.check_accounts(accounts)
+    return report.save()
+
+
+def _staked_by_user(transactions):
+    return dict(transactions.values_list('wallet__user').annotate(amount=staked_amount()).order_by().iterator(chunk_size=STREAM_CHUNK_SIZE))
+
+
+def reconcile_deposits_incremental(program_ids: Optional[List[str]] = None) -> List[DepositDiscrepancy]:
+    """
+    Reconcile deposits from the high-water mark of every program instead of the whole history.
+
+    Balances expected from SUCCESS transactions before the ReconciliationMark are kept in
+    ReconciledBalance, so a run reads only transactions created since the mark. Wallets touched
+    since the mark are verified against reconciled balance plus these transactions. Then the mark
+    moves to now minus RECONCILIATION_SAFETY_LAG and the transactions before it are folded in.
+    A program without mark is reconciled from the beginning.
+
+    :return: saved discrepancies
+    """
+    report = DiscrepancyReport()
+    new_mark = report.checked_at - RECONCILIATION_SAFETY_LAG
+    programs = Program.objects.all()
+    if program_ids is not None:
+        programs = programs.filter(id__in=program_ids)
+
+    for program_id in programs.values_list('id', flat=True):
+        mark = ReconciliationMark.objects.filter(program=program_id).first()
+        transactions = Transaction.objects.filter(program=program_id, status=Transaction.Status.SUCCESS)
+        touched = Transaction.objects.filter(program=program_id)
+        verified_until = new_mark
+        if mark is not None:
+            transactions, touched = transactions.filter(created_at__gte=mark.verified_until), touched.filter(created_at__gte=mark.verified_until)
+            # The mark never moves back, transactions before it are folded in already
+            verified_until = max(new_mark, mark.verified_until)
+
+        changes = _staked_by_user(transactions)
+        folded = _staked_by_user(transactions.filter(created_at__lt=verified_until))
+        users = set(touched.values_list('wallet__user', flat=True).distinct().order_by())
+        reconciled = dict(ReconciledBalance.objects.filter(program=program_id, user__in=users).values_list('user', 'balance'))
+
+        wallets = dict(Wallet.objects.filter(program=program_id, type=Wallet.Type.DEPOSIT, user__in=users).values_list('user', 'balance'))
+        for user_id in users:
+            expected = reconciled.get(user_id, 0) + changes.get(user_id, 0)
+            actual = wallets.get(user_id, 0)
+            if expected != actual:
+                report.add(program_id, user_id, expected, actual)
+
+        with transaction.atomic():
+            ReconciledBalance.objects.filter(program=program_id, user__in=folded).delete()
+            ReconciledBalance.objects.bulk_create([ReconciledBalance(program_id=program_id, user_id=user_id, balance=reconciled.get(user_id, 0) + amount) for user_id, amount in folded.items()], batch_size=STREAM_CHUNK_SIZE)
+            ReconciliationMark.objects.update_or_create(program_id=program_id, defaults={'verified_until': verified_until})
+
+    report.check_accounts(Account.objects.filter(type=Account.Type.DEPOSIT, program__in=programs))
+    return report.save()
@@ -0,0 +1,344 @@
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum, Case, When, F, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from blockcommon import fixedpoint
+from .database_rewards import reward_iteration
+from .models import Program, ProgramStats, Transaction, Reward, Wallet, StakeSnapshot, RewardRun
+
+__all__ = 'staked_amount', 'staked_by_user', 'total_staked', 'opening_stakes', 'reward_id', 'settle_interval', 'write_rewards', 'apply_transaction', 'calculate_program_rewards', 'check_rewardable', 'reward_iterations', 'run_telemetry', 'reward_lock_key', 'program_reward_lock',
+
+logger = logging.getLogger(__name__)
+
+WALLET_UPDATE_BATCH_SIZE = 1000
+STREAM_CHUNK_SIZE = 2000
+REWARD_ID_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'  # UTC, the same text as REWARD_ID_TIME in database_rewards
+
+
+def staked_amount():
+    """
+    Signed sum of transaction amounts: stakes are added, unstakes are subtracted
+    """
+    return Coalesce(Sum(Case(When(type=Transaction.Type.STAKE, then='amount'), When(type=Transaction.Type.UNSTAKE, then=F('amount') * -1), default=0, output_field=DecimalField())), 0, output_field=DecimalField())
+
+
+def staked_by_user(program: Program, before: datetime) -> Dict[int, int]:
+    """
+    Stake of every user of program at the moment `before`, in one grouped query
+
+    :return: dict of user id to fixed-point staked amount, users with zero stake are omitted
+    """
+    queryset = Transaction.objects.filter(program=program, created_at__lt=before, status=Transaction.Status.SUCCESS).values('wallet__user').annotate(amount=staked_amount()).order_by()
+    return {row['wallet__user']: fixedpoint.to_fixed(row['amount']) for row in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE) if row['amount']}
+
+
+def total_staked(program: Program, before: datetime) -> int:
+    return fixedpoint.to_fixed(Transaction.objects.filter(program=program, created_at__lt=before, status=Transaction.Status.SUCCESS).aggregate(amount=staked_amount())['amount'])
+
+
+def opening_stakes(program: Program, moment: datetime) -> Tuple[Dict[int, int], int]:
+    """
+    Stakes of program at boundary moment, from the snapshot of the previous run if there is one,
+    otherwise aggregated over the whole transaction history
+
+    :return: fixed-point stakes by user id and total stake
+    """
+    snapshot = StakeSnapshot.load(program.pk, moment)
+    if snapshot is not None:
+        return snapshot
+    return staked_by_user(program, moment), total_staked(program, moment)
+
+
+def per_user_logging() -> bool:
+    """
+    Per-user and per-transaction log lines of reward runs are formatted only when
+    settings.BLOCKFARM_REWARD_DEBUG_LOG is enabled
+    """
+    return getattr(settings, 'BLOCKFARM_REWARD_DEBUG_LOG', False)
+
+
+def reward_id(program_id, user_id, start_time: datetime, end_time: datetime) -> uuid.UUID:
+    """
+    Id of the reward of user for interval [start_time, end_time), the same on every replay of the
+    interval by any reward engine: the DATABASE engine computes the same md5 in SQL
+    """
+    start_time, end_time = (timezone.localtime(moment, timezone.utc).strftime(REWARD_ID_TIME_FORMAT) for moment in (start_time, end_time))
+    return uuid.UUID(hashlib.md5(f'{program_id}:{user_id}:{start_time}:{end_time}'.encode()).hexdigest())
+
+
+def settle_interval(program: Program, stakes: Dict[int, int], total_stack: int, start_time: datetime, end_time: datetime, reward_balance: int, scale: int) -> List[Reward]:
+    """
+    Rewards of every staker for interval [start_time, end_time) with constant stakes.
+    Stakes and balance are fixed-point ints, all amounts of the interval are allocated in one
+    vector operation and every reward is rounded down once to `scale` places.
+
+    :return: list of unsaved Reward instances
+    """
+    duration_between_stack = end_time - start_time
+    if not total_stack or not duration_between_stack:
+        return []
+
+    stakers = [(user_id, user_total_stack) for user_id, user_total_stack in stakes.items() if user_total_stack]
+    emitted = reward_balance * fixedpoint.microseconds(duration_between_stack)
+    denominator = total_stack * fixedpoint.microseconds(program.emit_duration)
+    amounts = fixedpoint.allocate([user_total_stack for _, user_total_stack in stakers], emitted, denominator, scale)
+    total_staked = fixedpoint.to_decimal(total_stack)
+    debug = per_user_logging()
+    rewards = []
+    for (user_id, user_total_stack), amount in zip(stakers, amounts):
+        reward_amount, user_staked = fixedpoint.to_decimal(amount), fixedpoint.to_decimal(user_total_stack)
+        if debug:
+            logger.debug(f"\t\tuser: {user_id}, user_total_stack: {user_staked}, reward_amount: {reward_amount}")
+        description = f"Rewarded {reward_amount} {program.reward_currency.code} with staked {user_staked}/{total_staked} {program.transaction_currency.code} from {start_time} to {end_time}"
+        rewards.append(Reward(id=reward_id(program.pk, user_id, start_time, end_time), user_id=user_id, currency=program.reward_currency, amount=reward_amount, program=program, user_staked=user_staked, total_staked=total_staked, duration=duration_between_stack, description=description))
+    return rewards
+
+
+def write_rewards(program: Program, rewards: List[Reward]) -> int:
+    """
+    Persist rewards of one interval and credit them to REWARD wallets.
+
+    Rewards are inserted with bulk_create, so `push_reward` is not sent for them; instead
+    the summed amount of every user is applied to the REWARD wallets with one set-based
+    update per batch of users, all in one database transaction.
+    Rewards whose id already exists were written by an earlier attempt and are skipped.
+
+    :return: amount of written rewards
+    """
+    if not rewards:
+        return 0
+
+    with transaction.atomic():
+        existing = set()
+        for index in range(0, len(rewards), WALLET_UPDATE_BATCH_SIZE):
+            existing.update(Reward.objects.filter(id__in=[reward.id for reward in rewards[index:index + WALLET_UPDATE_BATCH_SIZE]]).values_list('id', flat=True))
+        rewards = [reward for reward in rewards if reward.id not in existing]
+        if not rewards:
+            return 0
+
+        deltas = defaultdict(int)
+        for reward in rewards:
+            deltas[reward.user_id] += fixedpoint.to_fixed(reward.amount)
+        user_ids = list(deltas)
+
+        Reward.objects.bulk_create(rewards, batch_size=WALLET_UPDATE_BATCH_SIZE)
+        Wallet.objects.bulk_create([Wallet(type=Wallet.Type.REWARD, user_id=user_id, program=program) for user_id in user_ids], batch_size=WALLET_UPDATE_BATCH_SIZE, ignore_conflicts=True)
+        for index in range(0, len(user_ids), WALLET_UPDATE_BATCH_SIZE):
+            batch = user_ids[index:index + WALLET_UPDATE_BATCH_SIZE]
+            delta = Case(*[When(user_id=user_id, then=Value(fixedpoint.to_decimal(deltas[user_id]))) for user_id in batch], output_field=DecimalField())
+            Wallet.objects.filter(type=Wallet.Type.REWARD, program=program, user_id__in=batch).update(balance=F('balance') + delta)
+    return len(rewards)
+
+
+def apply_transaction(stakes: Dict[int, int], transaction_type: int, amount: int, user_id: int) -> int:
+    """
+    Apply a transaction to the stakes held in memory
+
+    :return: signed change of the total stake
+    """
+    if transaction_type == Transaction.Type.STAKE:
+        stakes[user_id] = stakes.get(user_id, 0) + amount
+        return amount
+    if transaction_type == Transaction.Type.UNSTAKE:
+        stakes[user_id] = stakes.get(user_id, 0) - amount
+        return -amount
+    return 0
+
+
+def calculate_program_rewards(program: Program, now: datetime, until: Optional[datetime] = None, since: Optional[datetime] = None) -> int:
+    """
+    Reward iterations of program in a single sweep over its transactions.
+
+    Stakes at the beginning of the first iteration are loaded once, from the snapshot written at
+    the end of the previous run, then transactions are walked in order: every transaction closes
+    the interval since the previous one, which is settled with the stakes held in memory, before
+    the transaction is applied.
+
+    Without `until` one iteration is rewarded. With `until` (catch-up mode) every complete
+    iteration ending not later than `until` is rewarded in the same pass.
+
+    Progress is kept in a RewardRun: rewards of every interval are committed together with its
+    cursor, and the end of every iteration together with program.last_rewarded and the stake
+    snapshot. A run interrupted inside an iteration is resumed from the cursor, replayed
+    intervals get the same reward ids and are not written twice.
+    With `since` rewarding restarts from that iteration boundary, not later than last_rewarded, to
+    backfill or re-run a range: rewards already written are skipped by their ids. Afterwards
+    last_rewarded is the later of its previous value and the end reached by the re-run.
+    Must be called under program_reward_lock.
+
+    :return: amount of rewarded iterations
+    """
+    logger.info(f"Calculating rewards for program {program.id} {program}")
+
+    check_rewardable(program, since)
+    previous = program.last_rewarded
+    if since is not None:
+        program.last_rewarded = since
+
+    if program.last_rewarded:
+        start_time = program.last_rewarded
+    else:
+        start_time = program.begin_date
+        program.last_rewarded = start_time
+
+    iterations = (min(until, now) - start_time) // program.iteration if until else 1
+    if iterations <= 0 or start_time + program.iteration > now:
+        program.last_rewarded = previous or program.last_rewarded
+        return 0
+
+    end_time = start_time + iterations * program.iteration
+    run = RewardRun.open(program, start_time, end_time)
+    try:
+        with run_telemetry(run):
+            reward_iterations(program, run, now, start_time, end_time, iterations)
+        run.finish(program.last_rewarded)
+    finally:
+        # A re-run of a past range, finished or not, must not move last_rewarded back
+        if previous is not None and program.last_rewarded < previous:
+            program.last_rewarded = previous
+            program.save(update_fields=['last_rewarded'])
+    ProgramStats.refresh(program.pk)
+    return iterations
+
+
+def check_rewardable(program: Program, since: Optional[datetime] = None):
+    """
+    Raise ValueError if program can not be rewarded, or re-run `since` a moment
+    """
+    if program.begin_date is None or not program.iteration:
+        raise ValueError(f"Program {program.id} has no begin date or iteration")
+    if since is not None:
+        if since < program.begin_date or (since - program.begin_date) % program.iteration or since > (program.last_rewarded or program.begin_date):
+            raise ValueError(f"{since} is not an iteration boundary of program {program.id} between its begin date and last reward")
+        if program.reward_engine == Program.RewardEngine.ACCUMULATOR:
+            raise ValueError(f"Program {program.id} settles rewards lazily, its iterations can not be re-run")
+
+
+@contextmanager
+def run_telemetry(run: RewardRun):
+    """
+    Count SQL queries executed by this connection while rewarding into run.queries
+    """
+    def count(execute, sql, params, many, context):
+        run.queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        yield run
+
+
+def reward_iterations(program: Program, run: RewardRun, now: datetime, start_time: datetime, end_time: datetime, iterations: int):
+    """
+    Reward `iterations` iterations of program from start_time to end_time with its reward engine,
+    recording progress and counters in run
+    """
+    if program.reward_engine == Program.RewardEngine.ACCUMULATOR:
+        # Stakers settle lazily against the index, the run only moves it forward
+        with transaction.atomic():
+            program.update_reward_per_token(now)
+            program.last_rewarded = end_time
+            program.save(update_fields=['last_rewarded'])
+            run.complete_iteration(iterations)
+        return
+
+    reward_balance = fixedpoint.to_fixed(program.reward_account.balance)
+
+    if program.reward_engine == Program.RewardEngine.DATABASE:
+        for iteration in range(iterations):
+            iteration_end = program.last_rewarded + program.iteration
+            with transaction.atomic():
+                run.rewards_written += reward_iteration(program, program.last_rewarded, iteration_end, reward_balance)
+                program.last_rewarded = iteration_end
+                program.save(update_fields=['last_rewarded'])
+                run.complete_iteration()
+        return
+
+    debug = per_user_logging()
+    stakes, total_stack = opening_stakes(program, start_time)
+
+    # Streamed from a server-side cursor, only the columns the sweep needs are loaded
+    transactions = Transaction.objects.filter(program=program, created_at__gte=start_time, created_at__lt=end_time, status=Transaction.Status.SUCCESS).order_by('created_at', 'id').values_list('id', 'created_at', 'type', 'amount', 'wallet__user').iterator(chunk_size=STREAM_CHUNK_SIZE)
+    pending = next(transactions, None)
+
+    if run.cursor_transaction_id is not None:
+        # Intervals up to the cursor are rewarded already, only their transactions are applied
+        cursor = (run.cursor_created_at, run.cursor_transaction_id)
+        while pending is not None and (pending[1], pending[0]) <= cursor:
+            total_stack += apply_transaction(stakes, pending[2], fixedpoint.to_fixed(pending[3]), pending[4])
+            run.transactions_scanned += 1
+            pending = next(transactions, None)
+        start_time = run.cursor_created_at
+
+    for iteration in range(iterations):
+        iteration_end = program.last_rewarded + program.iteration
+
+        while pending is not None and pending[1] < iteration_end:
+            transaction_id, created_at, transaction_type, amount, user_id = pending
+            if debug:
+                logger.info(f"\ttotal_stack: {fixedpoint.to_decimal(total_stack)}, interval: {start_time} - {created_at}")
+            rewards = settle_interval(program, stakes, total_stack, start_time, created_at, reward_balance, 18)
+            run.wallets_considered += len(stakes)
+            if rewards:
+                with transaction.atomic():
+                    run.rewards_written += write_rewards(program, rewards)
+                    ProgramStats.raise_max_staked(program.pk, rewards[0].total_staked)
+                    run.advance(transaction_id, created_at)
+            start_time = created_at
+            total_stack += apply_transaction(stakes, transaction_type, fixedpoint.to_fixed(amount), user_id)
+            run.transactions_scanned += 1
+            pending = next(transactions, None)
+
+        with transaction.atomic():
+            logger.info(f"End of iteration {iteration_end} of program {program.id}")
+            #  Calc end of iterations without transactions
+            if debug:
+                logger.info(f"\ttotal_stack: {fixedpoint.to_decimal(total_stack)}, interval: {start_time} - {iteration_end}")
+            rewards = settle_interval(program, stakes, total_stack, start_time, iteration_end, reward_balance, program.reward_currency.custodian_scale)
+            run.rewards_written += write_rewards(program, rewards)
+            if rewards:
+                ProgramStats.raise_max_staked(program.pk, rewards[0].total_staked)
+            run.wallets_considered += len(stakes)
+            StakeSnapshot.write(program.pk, iteration_end, stakes, total_stack)
+            program.last_rewarded = iteration_end
+            program.save(update_fields=['last_rewarded'])
+            run.complete_iteration()
+        start_time = iteration_end
+
+
+def reward_lock_key(program_id) -> int:
+    """
+    :return: advisory lock key of program, the high half of its UUID as a signed bigint
+    """
+    key = uuid.UUID(str(program_id)).int >> 64
+    return key - ((key >> 63) << 64)
+
+
+@contextmanager
+def program_reward_lock(program_id):
+    """
+    Session level PostgreSQL advisory lock of program rewarding.
+
+    A row lock can not be used here, as catch-up commits every iteration separately.
+
+    :return: context manager yielding True if the lock was acquired, False if it is held by another run
+    """
+    key = reward_lock_key(program_id)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+        acquired, = cursor.fetchone()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
@@ -26,14 +26,14 @@ class ProgramSerializer(serializers.Serializer):
     begin_date = serializers.DateTimeField(read_only=True)
     end_date = serializers.DateTimeField(read_only=True)
     prestake_date = serializers.DateTimeField(read_only=True)
-    total_staked = FixedDecimalField(read_only=True)
-    total_rewards = FixedDecimalField(read_only=True)
+    total_staked = FixedDecimalField(source='statistics.total_staked', read_only=True)
+    total_rewards = FixedDecimalField(source='statistics.total_rewards', read_only=True)
     links = ProgramLinkSerializer(many=True, read_only=True)
-    participants = serializers.IntegerField(read_only=True)
-    apy = serializers.DecimalField(decimal_places=2, max_digits=18, read_only=True)
-    max_participants = serializers.IntegerField(read_only=True)
-    max_staked = FixedDecimalField(read_only=True)
-    max_apy = serializers.DecimalField(decimal_places=2, max_digits=18, read_only=True)
+    participants = serializers.IntegerField(source='statistics.participants', read_only=True)
+    apy = serializers.DecimalField(source='statistics.apy', decimal_places=2, max_digits=18, read_only=True)
+    max_participants = serializers.IntegerField(source='statistics.max_participants', read_only=True)
+    max_staked = FixedDecimalField(source='statistics.max_staked', read_only=True)
+    max_apy = serializers.DecimalField(source='statistics.max_apy', decimal_places=2, max_digits=18, read_only=True)
 
     def create(self, validated_data):
         raise NotImplementedError('`create()` must be implemented.')
@@ -1,7 +1,9 @@
 import logging
-from django.db import DatabaseError
+from django.db import DatabaseError, transaction
 
-from blockfarm.models import Transaction, ClaimReward, Program, Reward
+from blockfarm.models import Account, Transaction, ClaimReward, Program, ProgramStats, Reward
+from blockcommon.rates import currency_rates
+from blockcommon.response_cache import invalidate_program_responses, invalidate_related_program_responses
 
 logger = logging.getLogger(__name__)
 
@@ -42,3 +44,53 @@ def push_reward(sender, instance: Reward, created, **kwargs):
 def create_program_accounts(sender, instance: Program, created, **kwargs):
     if created:
         instance.create_account()
+        ProgramStats.refresh(instance.pk)
+
+
+def start_reward_index(sender, instance: Program, **kwargs):
+    if instance._state.adding or instance.reward_engine != Program.RewardEngine.ACCUMULATOR:
+        return
+    if Program.objects.filter(pk=instance.pk).exclude(reward_engine=Program.RewardEngine.ACCUMULATOR).exists():
+        instance.start_accumulator()
+
+
+def invalidate_currency_rates(sender, **kwargs):
+    currency_rates.invalidate()
+
+
+def invalidate_program(sender, instance: Program, **kwargs):
+    invalidate_program_responses('blockfarm', instance.pk)
+
+
+def invalidate_program_of(sender, instance, **kwargs):
+    """
+    Account or ProgramStats of a program changed
+    """
+    invalidate_program_responses('blockfarm', instance.program_id)
+
+
+def refresh_program_stats(sender, instance: Account, **kwargs):
+    """
+    Account saved, e.g. a reward top-up or an admin edit: total_rewards and APY of the program
+    are recomputed once the change commits, then its responses are invalidated
+    """
+    program_id = instance.program_id
+
+    def refresh():
+        try:
+            ProgramStats.refresh(program_id)
+        except Exception:
+            logger.exception(f"Statistics refresh of program {program_id} failed")
+        invalidate_program_responses('blockfarm', program_id)
+
+    invalidate_program_responses('blockfarm', program_id)
+    transaction.on_commit(refresh)
+
+
+def invalidate_programs_of_link(sender, instance, **kwargs):
+    for program_id in instance.program_set.values_list('id', flat=True):
+        invalidate_program_responses('blockfarm', program_id)
+
+
+def invalidate_program_links(sender, instance, action, reverse, pk_set, **kwargs):
+    invalidate_related_program_responses('blockfarm', instance, action, reverse, pk_set)
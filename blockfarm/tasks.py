@@ -1,89 +1,135 @@
-import decimal
+import contextlib
 import logging
-
+import time
+
+from .models import Program, Reward
+from .reconciliation import reconcile_deposits, reconcile_deposits_incremental
+from .rewards import calculate_program_rewards, check_rewardable, program_reward_lock
+from .treasury_reconciliation import reconcile_treasury
+from django.db import transaction
+from django.db.models import Count, Sum
 from django.db.models.functions import Coalesce
-
-from common.utils.functional import round_down
-from .models import Program, Transaction, Reward, Wallet
 from django.utils import timezone
-from django.db.models import Sum, Case, When, F, DecimalField
+from django.utils.dateparse import parse_datetime
 import celery
 
 logger = logging.getLogger(__name__)
 
 
+def parse_moment(value):
+    """
+    :return: aware datetime from a datetime or an ISO 8601 string, None stays None
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def reward_arguments(program_ids=None, catch_up=False, until=None, since=None, dry_run=False):
+    """
+    Arguments of calculating_program_rewards for every program to reward: the given program ids,
+    or every enabled program which has begun. A re-run `since` a moment catches up to `until` or now.
+    Programs are checked up front, ValueError is raised before any of them is rewarded.
+    """
+    now = timezone.now()
+    until, since = parse_moment(until), parse_moment(since)
+    if (catch_up or since is not None) and until is None:
+        until = now
+
+    programs = Program.objects.filter(id__in=program_ids) if program_ids is not None else Program.objects.filter(is_enable=True, begin_date__lt=now)
+    programs = list(programs)
+    for program in programs:
+        check_rewardable(program, since)
+    return [(str(program.id), now.isoformat(), until.isoformat() if until else None, since.isoformat() if since else None, dry_run) for program in programs]
+
+
+@celery.shared_task(bind=True)
+def calculating_rewards(self, catch_up=False, until=None, program_ids=None, since=None, dry_run=False):
+    """
+    Dispatch rewarding of every enabled program: one subtask per program, run as a Celery chord
+    with a summary of per-program durations. A chord needs a result backend, without one the
+    subtasks run as a group and log their results themselves. When called directly (management
+    command, tests) programs are processed in the current process.
+
+    Reward one iteration of every program, or with catch_up every overdue iteration up to `until`
+    (default now). `until` and `since` may be datetimes or ISO 8601 strings, see reward_arguments
+    and calculating_program_rewards for the other options.
+    """
+    arguments = reward_arguments(program_ids, catch_up, until, since, dry_run)
+
+    if self.request.called_directly:
+        return summarize_rewards([calculating_program_rewards(*args) for args in arguments])
+    if arguments:
+        subtasks = [calculating_program_rewards.si(*args) for args in arguments]
+        if self.app.conf.result_backend:
+            celery.chord(subtasks)(summarize_rewards.s())
+        else:
+            celery.group(subtasks).apply_async()
+
+
+def reward_totals(program):
+    return Reward.objects.filter(program=program).aggregate(count=Count('id'), amount=Coalesce(Sum('amount'), 0))
+
+
 @celery.shared_task
-def calculating_rewards():
-    for program in Program.objects.filter(is_enable=True, begin_date__lt=timezone.now()):
-        logger.info(f"Calculating rewards for program {program.id} {program}")
+def calculating_program_rewards(program_id, now, until=None, since=None, dry_run=False):
+    """
+    Reward program under its lock, see calculate_program_rewards. With `dry_run` the rewarding runs
+    in one database transaction which is rolled back, the result reports the rewards it would write.
+    """
+    started = time.monotonic()
+    with program_reward_lock(program_id) as acquired:
+        if not acquired:
+            logger.warning(f"Rewarding of program {program_id} is already running, skipped")
+            return {'program': program_id, 'iterations': 0, 'duration': time.monotonic() - started, 'skipped': True}
+
+        with transaction.atomic() if dry_run else contextlib.nullcontext():
+            # Reloaded under the lock, last_rewarded may be moved by the previous run
+            program = Program.objects.select_related('transaction_currency', 'reward_currency').get(pk=program_id)
+            before = reward_totals(program) if dry_run else None
+            iterations = calculate_program_rewards(program, parse_datetime(now), parse_datetime(until) if until else None, parse_datetime(since) if since else None)
+            if dry_run:
+                after = reward_totals(program)
+                transaction.set_rollback(True)
+
+    result = {'program': program_id, 'iterations': iterations, 'duration': time.monotonic() - started, 'skipped': False}
+    if dry_run:
+        result.update(dry_run=True, rewards=after['count'] - before['count'], amount=str(after['amount'] - before['amount']))
+    return result
 
-        if program.last_rewarded:
-            start_time = program.last_rewarded
-        else:
-            start_time = program.begin_date
-            program.last_rewarded = start_time
-
-        if start_time + program.iteration > timezone.now():
-            continue
-
-        total_stack = Transaction.objects.filter(program=program, created_at__lt=start_time, status=Transaction.Status.SUCCESS).aggregate(amount=Coalesce(Sum(Case(When(type=0, then='amount'), When(type=1, then=F('amount') * -1), default=0, output_field=DecimalField())), 0, output_field=DecimalField()))['amount']
-
-        for transaction in Transaction.objects.filter(program=program, created_at__gte=start_time, created_at__lt=start_time + program.iteration, status=Transaction.Status.SUCCESS).order_by('created_at'):
-            logger.info(f"Calculating rewards for Transaction {transaction}")
-            logger.info(f"\ttotal_stack: {total_stack}")
-            duration_between_stack = transaction.created_at - start_time
-            logger.info(f"\tduration_between_stack: {duration_between_stack}")
-
-            if total_stack and duration_between_stack:
-                for wallet_stacked in Wallet.objects.filter(program=program, type=Wallet.Type.DEPOSIT):
-                    logger.info(f"\t\tuser: {wallet_stacked.user.email}")
-                    user_total_stack = Transaction.objects.filter(program=program, created_at__lt=transaction.created_at, wallet__user=wallet_stacked.user, status=Transaction.Status.SUCCESS).aggregate(amount=Coalesce(Sum(Case(When(type=Transaction.Type.STAKE, then='amount'), When(type=Transaction.Type.UNSTAKE, then=F('amount') * -1), default=0, output_field=DecimalField())), 0, output_field=DecimalField()))['amount']
-                    logger.info(f"\t\tuser_total_stack: {user_total_stack}")
-                    if user_total_stack != 0:
-                        reward_amount = (user_total_stack / total_stack) * decimal.Decimal(duration_between_stack / program.emit_duration) * program.reward_account.balance
-                        reward_amount = round_down(reward_amount, 18)
-                        logger.info(f"\t\treward_amount: {reward_amount}")
-                        description = f"Rewarded {reward_amount} {program.reward_currency.code} with staked {user_total_stack}/{total_stack} {program.transaction_currency.code} from {start_time} to {transaction.created_at}"
-                        created_reward = Reward.objects.create(user=wallet_stacked.user, currency=program.reward_currency, amount=reward_amount, program=program, user_staked=user_total_stack, total_staked=total_stack, duration=duration_between_stack, description=description)
-
-            start_time = transaction.created_at
-
-            if transaction.type == Transaction.Type.STAKE:
-                total_stack += transaction.amount
-
-            elif transaction.type == Transaction.Type.UNSTAKE:
-                total_stack -= transaction.amount
-
-        program.last_rewarded = program.last_rewarded + program.iteration
-
-        logger.info(f"End of iteration")
-        #  Calc end of iterations without transactions
-        if total_stack:
-            logger.info(f"\ttotal_stack: {total_stack}")
-            duration_between_stack = program.last_rewarded - start_time
-            logger.info(f"\tduration_between_stack: {duration_between_stack}")
-
-            for wallet_stacked in Wallet.objects.filter(program=program, type=Wallet.Type.DEPOSIT):
-                logger.info(f"\t\tuser: {wallet_stacked.user.email}")
-                user_total_stack = Transaction.objects.filter(program=program, created_at__lt=program.last_rewarded, wallet__user=wallet_stacked.user, status=Transaction.Status.SUCCESS).aggregate(amount=Coalesce(Sum(Case(When(type=Transaction.Type.STAKE, then='amount'), When(type=Transaction.Type.UNSTAKE, then=F('amount') * -1), default=0, output_field=DecimalField())), 0, output_field=DecimalField()))['amount']
-                logger.info(f"\t\tuser_total_stack: {user_total_stack}")
-                if user_total_stack != 0:
-                    reward_amount = (user_total_stack / total_stack) * decimal.Decimal(duration_between_stack / program.emit_duration) * program.reward_account.balance
-                    reward_amount = round_down(reward_amount, program.reward_currency.custodian_scale)
-                    logger.info(f"\t\treward_amount: {reward_amount}")
-                    description = f"Rewarded {reward_amount} {program.reward_currency.code} with staked {user_total_stack}/{total_stack} {program.transaction_currency.code} from {start_time} to {program.last_rewarded}"
-                    created_reward = Reward.objects.create(user=wallet_stacked.user, currency=program.reward_currency, amount=reward_amount, program=program, user_staked=user_total_stack, total_staked=total_stack, duration=duration_between_stack, description=description)
-
-        program.save()
+
+@celery.shared_task
+def summarize_rewards(results):
+    for result in results:
+        logger.info(f"Program {result['program']}: {result['iterations']} iterations in {result['duration']:.3f}s{' (skipped, locked)' if result['skipped'] else ''}")
+        if result.get('dry_run'):
+            logger.info(f"Program {result['program']}: dry run, {result['rewards']} rewards for {result['amount']} not written")
+    logger.info(f"Rewarded {len(results)} programs, {sum(result['iterations'] for result in results)} iterations, slowest {max((result['duration'] for result in results), default=0):.3f}s")
+    return results
 
 
 @celery.shared_task
-def check_deposit_balance():
-    for wallet in Wallet.objects.filter(type=Wallet.Type.DEPOSIT):
-        user_total_stack = Transaction.objects.filter(program=wallet.program,
-                                                      wallet__user=wallet.user,
-                                                      status=Transaction.Status.SUCCESS).aggregate(amount=Coalesce(
-            Sum(Case(When(type=Transaction.Type.STAKE, then='amount'),
-                     When(type=Transaction.Type.UNSTAKE, then=F('amount') * -1), default=0,
-                     output_field=DecimalField())), 0, output_field=DecimalField()))['amount']
-        assert wallet.balance == user_total_stack
+def check_deposit_balance(program_ids=None, since=None, incremental=False):
+    """
+    Reconcile deposit wallets and accounts, see reconcile_deposits. `since` may be a datetime or an ISO 8601 string.
+    With `incremental` every program is reconciled from its high-water mark, see reconcile_deposits_incremental.
+
+    :return: amount of found discrepancies
+    """
+    if incremental:
+        return len(reconcile_deposits_incremental(program_ids))
+    if isinstance(since, str):
+        since = parse_datetime(since)
+    return len(reconcile_deposits(program_ids, since))
+
+
+@celery.shared_task
+def check_treasury_balance(workers=None, rate=None):
+    """
+    Reconcile Treasury wallets of blockfarm and blockfunder accounts, see reconcile_treasury.
+
+    :return: amount of wallets which did not match or could not be fetched
+    """
+    return sum(check.status != check.Status.MATCH for check in reconcile_treasury(workers, rate))
@@ -1,7 +1,16 @@
+import decimal
 import logging
+from datetime import timedelta
 
 from rest_framework import status
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from blockfarm import metrics
+from blockfarm.models import Account, Program, ProgramStats, Wallet
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +21,75 @@ def test_list_of_programs(client, verified_user, program):
     assert response.status_code == status.HTTP_200_OK, response.data
 
 
+# +
+def test_list_of_programs_query_count(client, program):
+    cache.clear()
+    with CaptureQueriesContext(connection) as single:
+        response = client.get('/dapi/blockfarm/program/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+
+    for index in range(3):
+        extra = Program.objects.create(slug=f'{program.slug}-{index}', transaction_currency_id=1, reward_currency_id=2, is_enable=True, is_visible=True, begin_date=program.begin_date, emit_duration=program.emit_duration)
+        Account.objects.filter(program=extra, type=Account.Type.DEPOSIT).update(balance=10)
+
+    with CaptureQueriesContext(connection) as several:
+        response = client.get('/dapi/blockfarm/program/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    assert len(several) == len(single)
+
+
+# +
+def test_program_reads_stats(client, program):
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(balance=10)
+    ProgramStats.refresh(program.id)
+
+    response = client.get(f'/dapi/blockfarm/program/{program.id}/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    assert decimal.Decimal(response.data['total_staked']) == 10
+
+
+# +
+def test_account_save_refreshes_stats(client, program, monkeypatch):
+    # Run on_commit callbacks at once, the test transaction never commits
+    monkeypatch.setattr(transaction, 'on_commit', lambda func: func())
+    account = program.reward_account
+    account.balance = 500
+    account.save()
+
+    assert ProgramStats.objects.get(program=program).total_rewards == 500
+    response = client.get(f'/dapi/blockfarm/program/{program.id}/')
+    assert decimal.Decimal(response.data['total_rewards']) == 500
+
+
+# +
+def test_program_without_stats_reads_zeros(client, program):
+    cache.clear()
+    ProgramStats.objects.filter(program=program).delete()
+    response = client.get(f'/dapi/blockfarm/program/{program.id}/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    assert decimal.Decimal(response.data['total_staked']) == 0
+    assert not ProgramStats.objects.filter(program=program).exists()
+
+
+# +
+def test_program_response_cache(client, program):
+    cache.clear()
+    response = client.get(f'/dapi/blockfarm/program/{program.id}/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    assert decimal.Decimal(response.data['total_staked']) == 0
+
+    # Updated without signals, the cached response is served
+    ProgramStats.objects.filter(program=program).update(total_staked=10)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(f'/dapi/blockfarm/program/{program.id}/')
+    assert decimal.Decimal(response.data['total_staked']) == 0
+    assert len(queries) == 0
+
+    ProgramStats.objects.get(program=program).save()
+    response = client.get(f'/dapi/blockfarm/program/{program.id}/')
+    assert decimal.Decimal(response.data['total_staked']) == 10
+
+
 # +
 def test_get_program_by_id(client, verified_user, program):
     response = client.get(f'/dapi/blockfarm/program/{program.id}/')
@@ -92,3 +170,36 @@ def test_create_claim_reward_not_allowed(verified_client, verified_user, program
 def test_get_reward_status_by_user_and_program(verified_client, verified_user, program):
     response = verified_client.get(f'/dapi/blockfarm/program/{program.id}/reward_status/')
     assert response.status_code == status.HTTP_200_OK, response.data
+
+
+# +
+def test_reward_status_pending_after_switch_to_accumulator(verified_client, verified_user, program):
+    # Swept up to the middle of an emission which has ended
+    program.begin_date = timezone.now() - timedelta(days=40)
+    program.last_rewarded = program.begin_date + timedelta(days=20)
+    program.reward_per_token = 5
+    program.save()
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(balance=10)
+    Account.objects.filter(program=program, type=Account.Type.REWARD).update(balance=3000)
+    Wallet.objects.create(user=verified_user, type=Wallet.Type.DEPOSIT, program=program, balance=10)
+
+    program.reward_engine = Program.RewardEngine.ACCUMULATOR
+    program.save()
+
+    response = verified_client.get(f'/dapi/blockfarm/program/{program.id}/reward_status/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    # Only the last 10 of 30 days are pending: 3000 * 10 / 30
+    assert decimal.Decimal(response.data['current_rewarded']) == 1000
+
+
+# +
+def test_metrics(client, settings, program):
+    settings.METRICS_TOKEN = 'secret'
+    metrics._cache['expires'] = 0
+    response = client.get('/dapi/blockfarm/metrics/')
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response = client.get('/dapi/blockfarm/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+    assert response.status_code == status.HTTP_200_OK
+    assert f'blockfarm_reward_lag_seconds{{program="{program.id}",slug="{program.slug}"}}' in response.content.decode()
+    assert 'blockfunder_transactions{status="pending"}' in response.content.decode()
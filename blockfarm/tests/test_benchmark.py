@@ -0,0 +1,107 @@
+import decimal
+import json
+import os
+import random
+import tracemalloc
+from datetime import timedelta
+
+import pytest
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from blockfarm import tasks
+from blockfarm.models import Account, Program, Transaction, Wallet, RewardRun
+
+# Benchmarks of the reward engines on synthetic programs, skipped unless BLOCKFARM_BENCHMARK is set:
+#
+#   BLOCKFARM_BENCHMARK=1 BLOCKFARM_BENCHMARK_STAKERS=1000,10000,100000 pytest blockfarm/tests/test_benchmark.py
+#
+# BLOCKFARM_BENCHMARK_TRANSACTIONS transactions per iteration (default 100)
+# BLOCKFARM_BENCHMARK_ITERATIONS rewarded iterations (default 3)
+# BLOCKFARM_BENCHMARK_OUTPUT JSON file the results are appended to (default blockfarm-benchmark.json)
+
+pytestmark = pytest.mark.skipif(not os.environ.get('BLOCKFARM_BENCHMARK'), reason='set BLOCKFARM_BENCHMARK=1 to run reward benchmarks')
+
+STAKERS = [int(stakers) for stakers in os.environ.get('BLOCKFARM_BENCHMARK_STAKERS', '1000').split(',')]
+TRANSACTIONS_PER_ITERATION = int(os.environ.get('BLOCKFARM_BENCHMARK_TRANSACTIONS', '100'))
+ITERATIONS = int(os.environ.get('BLOCKFARM_BENCHMARK_ITERATIONS', '3'))
+OUTPUT = os.environ.get('BLOCKFARM_BENCHMARK_OUTPUT', 'blockfarm-benchmark.json')
+BATCH_SIZE = 5000
+
+
+def create_synthetic_program(stakers, transactions_per_iteration, iterations, reward_engine):
+    """
+    Program whose `iterations` iterations are due, with `stakers` users staked before it begins
+    and `transactions_per_iteration` stakes and unstakes inside every iteration, all bulk inserted
+    """
+    iteration = timedelta(hours=1)
+    begin_date = timezone.now() - iterations * iteration - timedelta(minutes=1)
+    program = Program.objects.create(slug=f'benchmark{stakers}x{reward_engine}', transaction_currency_id=1, reward_currency_id=2, is_enable=True, is_visible=True, begin_date=begin_date, emit_duration=timedelta(days=30), iteration=iteration, reward_engine=reward_engine)
+    Account.objects.filter(program=program, type=Account.Type.REWARD).update(balance=decimal.Decimal('1000000'))
+    deposit_account = program.deposit_account
+
+    users = User.objects.bulk_create([User(username=f'benchmark-{program.id}-{index}', email=f'benchmark-{index}@{program.slug}.test') for index in range(stakers)], batch_size=BATCH_SIZE)
+    wallets = Wallet.objects.bulk_create([Wallet(type=Wallet.Type.DEPOSIT, user=user, program=program, balance=100) for user in users], batch_size=BATCH_SIZE)
+
+    def transaction(wallet, amount, type, created_at):
+        return Transaction(user_id=wallet.user_id, currency_id=1, amount=amount, wallet=wallet, account=deposit_account, type=type, status=Transaction.Status.SUCCESS, program=program, created_at=created_at)
+
+    transactions = [transaction(wallet, 100, Transaction.Type.STAKE, begin_date - timedelta(minutes=1)) for wallet in wallets]
+    randomizer = random.Random(stakers)
+    for index in range(iterations):
+        for _ in range(transactions_per_iteration):
+            created_at = begin_date + index * iteration + timedelta(seconds=randomizer.randrange(int(iteration.total_seconds())))
+            type = randomizer.choice([Transaction.Type.STAKE, Transaction.Type.UNSTAKE])
+            transactions.append(transaction(randomizer.choice(wallets), 1, type, created_at))
+
+    # created_at is auto_now, bulk_create would overwrite the synthetic timestamps
+    field = Transaction._meta.get_field('created_at')
+    field.auto_now = False
+    try:
+        Transaction.objects.bulk_create(transactions, batch_size=BATCH_SIZE)
+    finally:
+        field.auto_now = True
+    return program
+
+
+def save_result(result):
+    results = []
+    if os.path.exists(OUTPUT):
+        with open(OUTPUT) as output:
+            results = json.load(output)
+    results.append(result)
+    with open(OUTPUT, 'w') as output:
+        json.dump(results, output, indent=2)
+
+
+@pytest.mark.parametrize('reward_engine', [Program.RewardEngine.SWEEP, Program.RewardEngine.DATABASE])
+@pytest.mark.parametrize('stakers', STAKERS)
+def test_benchmark_rewards(db, httpserver, stakers, reward_engine):
+    # The reward run does not call Treasury, the stand-in only guards against accidental calls
+    settings.TREASURY_URL = httpserver.url_for("")[:-1]
+    program = create_synthetic_program(stakers, TRANSACTIONS_PER_ITERATION, ITERATIONS, reward_engine)
+    now = timezone.now()
+
+    tracemalloc.start()
+    try:
+        result = tasks.calculating_program_rewards(str(program.id), now.isoformat(), now.isoformat())
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert result['iterations'] == ITERATIONS
+    run = RewardRun.objects.get(program=program)
+    save_result({
+        'engine': dict(Program.RewardEngine.CHOICES)[reward_engine],
+        'stakers': stakers,
+        'transactions_per_iteration': TRANSACTIONS_PER_ITERATION,
+        'iterations': ITERATIONS,
+        'wall_time': result['duration'],
+        'queries': run.queries,
+        'peak_memory': peak_memory,
+        'peak_rss': run.peak_rss,
+        'rewards': run.rewards_written,
+        'rewards_per_second': run.rewards_written / result['duration'],
+        'created_at': now.isoformat(),
+    })
@@ -0,0 +1,41 @@
+import decimal
+
+from blockcommon.rates import currency_rates
+from exchange.models import Currency
+
+
+# Approve
+def test_currency_rates_snapshot(db, settings):
+    settings.CURRENCY_RATE_TTL = 60
+    currency_rates.invalidate()
+    snapshot = currency_rates.snapshot()
+    rate = snapshot.usd_rate(1)
+
+    # Not saved through the model, the snapshot is kept until the TTL expires
+    Currency.objects.filter(pk=1).update(usd_rate=rate + 1)
+    assert currency_rates.snapshot() is snapshot
+    assert currency_rates.usd_rate(1) == rate
+
+    currency = Currency.objects.get(pk=1)
+    currency.usd_rate = decimal.Decimal(rate) + 2
+    currency.save()
+    assert currency_rates.usd_rate(1) == decimal.Decimal(rate) + 2
+    assert currency_rates.snapshot().taken_at >= snapshot.taken_at
+    # Rates saved here are rolled back with the test database
+    currency_rates.invalidate()
+
+
+# Approve
+def test_currency_rates_snapshot_for_new_currency(db, settings):
+    settings.CURRENCY_RATE_TTL = 60
+    currency_rates.invalidate()
+    snapshot = currency_rates.snapshot()
+    assert currency_rates.snapshot_for(1) is snapshot
+
+    # A currency created in another process is missing from the snapshot until it is reloaded
+    del snapshot.rates[1]
+    reloaded = currency_rates.snapshot_for(1)
+    assert reloaded is not snapshot
+    assert 1 in reloaded.rates
+    assert reloaded.taken_at >= snapshot.taken_at
+    currency_rates.invalidate()
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from blockfarm import tasks
+from blockfarm.models import Account, Transaction, Wallet, DepositDiscrepancy, ReconciliationMark, ReconciledBalance, TreasuryBalanceCheck
+from blockfarm.tests.test_rewards import create_success_transaction
+
+
+# Approve
+def test_reconcile_deposits(program, django_user_model):
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date)
+    create_success_transaction(program, user_2, 30, program.begin_date)
+    create_success_transaction(program, user_2, 5, program.begin_date, type=Transaction.Type.UNSTAKE)
+    Wallet.objects.filter(program=program, user=user_1, type=Wallet.Type.DEPOSIT).update(balance=10)
+    Wallet.objects.filter(program=program, user=user_2, type=Wallet.Type.DEPOSIT).update(balance=20)
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(balance=35)
+
+    assert tasks.check_deposit_balance([str(program.id)]) == 2
+
+    wallet_discrepancy = DepositDiscrepancy.objects.get(program=program, user=user_2)
+    assert (wallet_discrepancy.expected, wallet_discrepancy.actual) == (25, 20)
+    account_discrepancy = DepositDiscrepancy.objects.get(program=program, user=None)
+    assert (account_discrepancy.expected, account_discrepancy.actual) == (30, 35)
+
+    # Only wallets with recent transactions
+    assert tasks.check_deposit_balance([str(program.id)], timezone.now() + timedelta(minutes=1)) == 1
+
+
+# Approve
+def test_reconcile_deposits_incremental(program, django_user_model):
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    create_success_transaction(program, user_1, 10, timezone.now() - timedelta(days=1))
+    Wallet.objects.filter(program=program, user=user_1, type=Wallet.Type.DEPOSIT).update(balance=10)
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(balance=10)
+
+    assert tasks.check_deposit_balance([str(program.id)], incremental=True) == 0
+    assert ReconciledBalance.objects.get(program=program, user=user_1).balance == 10
+    mark = ReconciliationMark.objects.get(program=program).verified_until
+
+    # Old history is not read again
+    Transaction.objects.filter(program=program, created_at__lt=mark).update(amount=1000)
+    create_success_transaction(program, user_1, 5, timezone.now())
+    Wallet.objects.filter(program=program, user=user_1, type=Wallet.Type.DEPOSIT).update(balance=15)
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(balance=15)
+
+    assert tasks.check_deposit_balance([str(program.id)], incremental=True) == 0
+    # The new transaction is inside the safety lag, it is verified but not folded in yet
+    assert ReconciledBalance.objects.get(program=program, user=user_1).balance == 10
+
+
+# Approve
+def test_reconcile_treasury(program, httpserver):
+    settings.TREASURY_URL = httpserver.url_for("")[:-1]
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(treasury_id=201, balance=35)
+    Account.objects.filter(program=program, type=Account.Type.REWARD).update(treasury_id=202, balance=100)
+    httpserver.expect_request("/wallets/201").respond_with_json({"id": 201, "balance": "35.00000000000000000000"})
+    httpserver.expect_request("/wallets/202").respond_with_json({"id": 202, "balance": "90.00000000000000000000"})
+
+    assert tasks.check_treasury_balance(workers=2, rate=100) == 1
+
+    match = TreasuryBalanceCheck.objects.get(treasury_id=201)
+    assert (match.status, match.expected, match.actual) == (TreasuryBalanceCheck.Status.MATCH, 35, 35)
+    mismatch = TreasuryBalanceCheck.objects.get(treasury_id=202)
+    assert (mismatch.status, mismatch.expected, mismatch.actual) == (TreasuryBalanceCheck.Status.MISMATCH, 100, 90)
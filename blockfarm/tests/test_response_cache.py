@@ -0,0 +1,45 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from blockcommon import response_cache
+
+
+# Approve
+def test_cached_response_waits_for_the_computing_request(monkeypatch):
+    cache.clear()
+    key = 'program-response:test:wait'
+    # Another request is computing the response
+    cache.add(f'{key}:lock', 1, response_cache.LOCK_TIMEOUT)
+
+    def finish_other_request(seconds):
+        cache.set(key, {'computed': 'by other request'})
+
+    monkeypatch.setattr(response_cache.time, 'sleep', finish_other_request)
+    response = response_cache.cached_response(key, lambda: pytest.fail('computed twice'))
+
+    assert response.data == {'computed': 'by other request'}
+    # The lock belongs to the other request
+    assert cache.get(f'{key}:lock') == 1
+    cache.clear()
+
+
+# Approve
+def test_cached_response_computes_after_lock_timeout(monkeypatch):
+    cache.clear()
+    key = 'program-response:test:timeout'
+    cache.add(f'{key}:lock', 1, response_cache.LOCK_TIMEOUT)
+
+    clock = [0.0]
+
+    def sleep(seconds):
+        clock[0] += seconds
+
+    monkeypatch.setattr(response_cache.time, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(response_cache.time, 'sleep', sleep)
+    response = response_cache.cached_response(key, lambda: Response({'computed': 'here'}))
+
+    assert response.data == {'computed': 'here'}
+    assert cache.get(key) == {'computed': 'here'}
+    assert clock[0] >= response_cache.LOCK_TIMEOUT
+    cache.clear()
@@ -0,0 +1,464 @@
+import decimal
+from datetime import timedelta
+
+import pytest
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from blockcommon import fixedpoint
+from blockcommon.rates import RateSnapshot, currency_rates
+from blockfarm import tasks
+from blockfarm.rewards import reward_lock_key
+from blockfarm.models import Account, Program, ProgramStats, Transaction, Reward, Wallet, StakeCheckpoint, StakeSnapshot, RewardRun
+
+
+def create_success_transaction(program, user, amount, created_at, type=Transaction.Type.STAKE):
+    wallet, _ = Wallet.objects.get_or_create(user=user, type=Wallet.Type.DEPOSIT, program=program)
+    tx, = Transaction.objects.bulk_create([Transaction(user=user, currency_id=1, amount=amount, wallet=wallet, account=program.deposit_account, type=type, status=Transaction.Status.SUCCESS, program=program)])
+    Transaction.objects.filter(id=tx.id).update(created_at=created_at)
+    return tx
+
+
+def user_rewards(program, user):
+    return Reward.objects.filter(program=program, user=user).aggregate(amount=Sum('amount'))['amount']
+
+
+# Approve
+def test_sweep_rewards_two_users(short_program_with_reward, django_user_model):
+    program = short_program_with_reward
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_2, 30, program.begin_date + timedelta(minutes=15))
+
+    tasks.calculating_rewards()
+
+    # 720 * 15 / 60 + 720 * 45 / 60 * 10 / 40
+    assert user_rewards(program, user_1) == 315
+    # 720 * 45 / 60 * 30 / 40
+    assert user_rewards(program, user_2) == 405
+    assert Reward.objects.filter(program=program).count() == 3
+    assert Wallet.objects.get(program=program, user=user_1, type=Wallet.Type.REWARD).balance == 315
+    assert Wallet.objects.get(program=program, user=user_2, type=Wallet.Type.REWARD).balance == 405
+
+    # Raised by the reward run
+    assert ProgramStats.objects.get(program=program).max_staked == 40
+    # Transactions were inserted without create_transaction, only the backfill counts their users
+    call_command('backfillprogramstats', str(program.id))
+    stats = ProgramStats.objects.get(program=program)
+    assert (stats.max_participants, stats.max_staked) == (2, 40)
+
+
+# Approve
+def test_sweep_rewards_unstake(short_program_with_reward, django_user_model):
+    program = short_program_with_reward
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_2, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_2, 10, program.begin_date + timedelta(minutes=30), type=Transaction.Type.UNSTAKE)
+
+    tasks.calculating_rewards()
+
+    # 720 * 30 / 60 / 2 + 720 * 30 / 60
+    assert user_rewards(program, user_1) == 540
+    assert user_rewards(program, user_2) == 180
+    assert Wallet.objects.get(program=program, user=user_2, type=Wallet.Type.REWARD).balance == 180
+
+
+# Approve
+def test_accumulator_rewards(short_program_with_reward, django_user_model):
+    program = short_program_with_reward
+    program.reward_engine = Program.RewardEngine.ACCUMULATOR
+    program.save()
+    Account.objects.filter(program=program, type=Account.Type.DEPOSIT).update(balance=40)
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    wallet_1 = Wallet.objects.create(type=Wallet.Type.DEPOSIT, balance=10, program=program, user=user_1)
+    wallet_2 = Wallet.objects.create(type=Wallet.Type.DEPOSIT, balance=30, program=program, user=user_2)
+
+    tasks.calculating_rewards()
+    assert Reward.objects.filter(program=program).count() == 0
+
+    # Emission stops at end_date: 720 / 40 per staked token
+    program.refresh_from_db()
+    assert program.accrued_reward_per_token(timezone.now()) == 18
+    assert wallet_1.pending_reward(program.accrued_reward_per_token(timezone.now())) == 180
+
+    with transaction.atomic():
+        wallet_2.settle_reward(timezone.now())
+    assert user_rewards(program, user_2) == 540
+    assert Wallet.objects.get(program=program, user=user_2, type=Wallet.Type.REWARD).balance == 540
+    assert wallet_2.pending_reward(program.accrued_reward_per_token(timezone.now())) == 0
+
+
+# Approve
+def test_stake_checkpoint_share(program, django_user_model):
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    start = program.begin_date
+    with transaction.atomic():
+        StakeCheckpoint.record(program.id, user_1.id, 10, start)
+        StakeCheckpoint.record(program.id, user_2.id, 30, start + timedelta(hours=1))
+        StakeCheckpoint.record(program.id, user_2.id, -30, start + timedelta(hours=2))
+
+    assert StakeCheckpoint.stake_seconds_at(program.id, user_1.id, start + timedelta(hours=2)) == 10 * 7200
+    assert StakeCheckpoint.stake_seconds_at(program.id, None, start + timedelta(hours=3)) == 10 * 10800 + 30 * 3600
+    assert StakeCheckpoint.share(program.id, user_1.id, start, start + timedelta(hours=1)) == 1
+    assert StakeCheckpoint.share(program.id, user_2.id, start + timedelta(hours=1), start + timedelta(hours=2)) == decimal.Decimal('0.75')
+    assert StakeCheckpoint.share(program.id, user_2.id, start + timedelta(hours=2), start + timedelta(hours=3)) == 0
+
+    # Exact to 18 places where the 28 digit Decimal context would round
+    user_3 = django_user_model.objects.create(username="user_3", password="12345", email='w@w.w')
+    with transaction.atomic():
+        StakeCheckpoint.record(program.id, user_3.id, decimal.Decimal('123456789.123456789123456789'), start)
+    assert StakeCheckpoint.stake_seconds_at(program.id, user_3.id, start + timedelta(seconds=1, microseconds=1)) == decimal.Decimal('123456912.580245912580245912')
+
+
+# Approve
+def test_catch_up_rewards(short_program_with_reward_30min, django_user_model):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_1, 10, program.begin_date + timedelta(minutes=45))
+
+    tasks.calculating_rewards(catch_up=True, until=program.begin_date + timedelta(hours=2, minutes=10))
+
+    program.refresh_from_db()
+    assert program.last_rewarded == program.begin_date + timedelta(hours=2)
+    assert Reward.objects.filter(program=program).count() == 5
+    # 720 * 30 / 60 per iteration
+    assert user_rewards(program, user_1) == 4 * 360
+
+
+# Approve
+def test_dry_run_and_rerun_rewards(short_program_with_reward_30min, django_user_model):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    until = program.begin_date + timedelta(hours=1)
+    last_rewarded = program.last_rewarded
+
+    result, = tasks.calculating_rewards(catch_up=True, until=until, program_ids=[str(program.id)], dry_run=True)
+
+    assert (result['iterations'], result['rewards'], decimal.Decimal(result['amount'])) == (2, 2, 720)
+    program.refresh_from_db()
+    assert program.last_rewarded == last_rewarded
+    assert not Reward.objects.filter(program=program).exists()
+    assert not RewardRun.objects.filter(program=program).exists()
+
+    tasks.calculating_rewards(catch_up=True, until=until, program_ids=[str(program.id)])
+    # Re-run of the rewarded range writes nothing twice
+    tasks.calculating_rewards(until=until, since=program.begin_date, program_ids=[str(program.id)])
+
+    assert user_rewards(program, user_1) == 720
+    assert Wallet.objects.get(program=program, user=user_1, type=Wallet.Type.REWARD).balance == 720
+    program.refresh_from_db()
+    assert program.last_rewarded == until
+
+    # Re-run of the first iteration only keeps last_rewarded at the end of the rewarded range
+    tasks.calculating_rewards(until=program.begin_date + program.iteration, since=program.begin_date, program_ids=[str(program.id)])
+    program.refresh_from_db()
+    assert program.last_rewarded == until
+
+    with pytest.raises(ValueError):
+        tasks.calculating_rewards(until=until, since=program.begin_date + timedelta(minutes=10), program_ids=[str(program.id)])
+
+    # Programs given explicitly are checked before any is rewarded
+    not_begun = Program.objects.create(slug=program.slug + 'nb', transaction_currency_id=1, reward_currency_id=2)
+    with pytest.raises(ValueError):
+        tasks.calculating_rewards(catch_up=True, program_ids=[str(program.id), str(not_begun.id)])
+
+
+# Approve
+def test_database_rewards_match_sweep(short_program_with_reward_30min, django_user_model):
+    sweep_program = short_program_with_reward_30min
+    database_program = Program.objects.create(slug=sweep_program.slug + 'db', transaction_currency_id=1, reward_currency_id=2, is_enable=True, is_visible=True, begin_date=sweep_program.begin_date, emit_duration=sweep_program.emit_duration, iteration=sweep_program.iteration, reward_engine=Program.RewardEngine.DATABASE)
+    Account.objects.filter(program=database_program, type=Account.Type.REWARD).update(balance=sweep_program.reward_account.balance)
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    for program in (sweep_program, database_program):
+        create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+        create_success_transaction(program, user_2, 30, program.begin_date + timedelta(minutes=15))
+        create_success_transaction(program, user_1, 5, program.begin_date + timedelta(minutes=45), type=Transaction.Type.UNSTAKE)
+        create_success_transaction(program, user_2, 5, program.begin_date + timedelta(minutes=45))
+
+    tasks.calculating_rewards(catch_up=True, until=sweep_program.begin_date + timedelta(hours=1))
+
+    # 180 + 45 + 45 + 22.5
+    assert user_rewards(sweep_program, user_1) == decimal.Decimal('292.5')
+    for user in (user_1, user_2):
+        assert user_rewards(database_program, user) == user_rewards(sweep_program, user)
+        assert Wallet.objects.get(program=database_program, user=user, type=Wallet.Type.REWARD).balance == user_rewards(sweep_program, user)
+    assert Reward.objects.filter(program=database_program).count() == Reward.objects.filter(program=sweep_program).count()
+
+
+# Approve
+def test_fixedpoint_conversions():
+    one = fixedpoint.ONE
+    # Digits beyond 18 places are dropped, not rounded
+    assert fixedpoint.to_fixed(decimal.Decimal('1.0000000000000000019')) == one + 1
+    assert fixedpoint.to_fixed('-0.5') == -one // 2
+    assert fixedpoint.to_fixed(7) == 7 * one
+    # Exact beyond the 28 digits of the default context
+    assert fixedpoint.to_decimal(10 ** 40 + 1) == decimal.Decimal('10000000000000000000000.000000000000000001')
+    assert fixedpoint.to_fixed(fixedpoint.to_decimal(10 ** 40 + 1)) == 10 ** 40 + 1
+
+
+# Approve
+def test_fixedpoint_power():
+    one = fixedpoint.ONE
+    assert fixedpoint.power(2 * one, 10) == 1024 * one
+    assert fixedpoint.power(3 * one, 0) == one
+    # Every multiplication rounds down: (1 + 1e-18)^2 loses its 1e-36 term
+    assert fixedpoint.power(one + 1, 2) == one + 2
+
+
+# Approve
+def test_program_apy(program, monkeypatch):
+    monkeypatch.setattr(currency_rates, 'snapshot_for', lambda *currency_ids: RateSnapshot({1: decimal.Decimal(2), 2: decimal.Decimal(1)}, timezone.now()))
+    Account.objects.filter(program=program, type=Account.Type.REWARD).update(balance=30)
+
+    # 30 USD of rewards over 30 days for 2000 USD staked: 1.5% monthly
+    apy = program._apy(decimal.Decimal(1000))
+    assert abs(apy - (decimal.Decimal('1.015') ** 12 - 1)) < decimal.Decimal('1e-15')
+    assert program._apy(0) == 1000
+    # Capped for a tiny stake
+    assert program._apy(decimal.Decimal('0.000001')) == 1000
+
+
+# Approve
+def test_database_rewards_prune_stake_snapshots(short_program_with_reward_30min, django_user_model, settings):
+    program = short_program_with_reward_30min
+    program.reward_engine = Program.RewardEngine.DATABASE
+    program.save()
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    settings.STAKE_SNAPSHOT_RETENTION = timedelta(minutes=30)
+
+    tasks.calculating_rewards(catch_up=True, until=program.begin_date + timedelta(hours=1, minutes=30))
+
+    # Boundaries at 30, 60 and 90 minutes were written, the first is beyond the retention window
+    assert sorted(set(StakeSnapshot.objects.filter(program=program).values_list('created_at', flat=True))) == [program.begin_date + timedelta(hours=1), program.begin_date + timedelta(hours=1, minutes=30)]
+
+
+# Approve
+def test_rerun_after_engine_switch_writes_nothing_twice(short_program_with_reward_30min, django_user_model):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_2, 30, program.begin_date + timedelta(minutes=15))
+    until = program.begin_date + timedelta(hours=1)
+    tasks.calculating_rewards(catch_up=True, until=until, program_ids=[str(program.id)])
+    rewards = Reward.objects.filter(program=program).count()
+
+    # Both engines derive the same ids, a re-run by the other engine finds every reward written
+    for engine in (Program.RewardEngine.DATABASE, Program.RewardEngine.SWEEP):
+        Program.objects.filter(id=program.id).update(reward_engine=engine)
+        tasks.calculating_rewards(until=until, since=program.begin_date, program_ids=[str(program.id)])
+
+        assert Reward.objects.filter(program=program).count() == rewards
+        assert user_rewards(program, user_1) == 315
+        assert Wallet.objects.get(program=program, user=user_1, type=Wallet.Type.REWARD).balance == 315
+        assert Wallet.objects.get(program=program, user=user_2, type=Wallet.Type.REWARD).balance == 405
+
+
+# Approve
+def test_allocate_matches_mul_div():
+    one = fixedpoint.ONE
+    shares = [10 * one, 30 * one, 1, 7, 123456789]
+    cases = [(720 * one * 900, 40 * one * 3600), (7, 3), (-7, 3), (10 ** 30 + 1, 3 * 10 ** 25)]
+    for numerator, denominator in cases:
+        for places in (18, 8, 0):
+            assert fixedpoint.allocate(shares, numerator, denominator, places) == [fixedpoint.round_down(fixedpoint.mul_div(share, numerator, denominator), places) for share in shares]
+
+
+# Approve
+def test_allocate_limbs_realistic_amounts():
+    pytest.importorskip('numpy')
+    one = fixedpoint.ONE
+    # Stakes from a fraction of a token to a billion tokens, far beyond int64
+    shares = [one // 3, 10 * one, 12345678 * one + 987654321, 10 ** 9 * one, 0]
+    total = sum(shares)
+    numerator, denominator = 720 * one * 900 * 10 ** 6, total * 30 * 86400 * 10 ** 6
+    assert fixedpoint._allocate_limbs(shares, numerator, denominator) == [share * numerator // denominator for share in shares]
+    for places in (18, 8):
+        assert fixedpoint.allocate(shares, numerator, denominator, places) == [fixedpoint.round_down(fixedpoint.mul_div(share, numerator, denominator), places) for share in shares]
+    # Exact multiples sit on the rounding boundary of the estimate
+    assert fixedpoint._allocate_limbs([denominator * 3, denominator * 7 - 1], numerator, denominator) == [numerator * 3, numerator * 7 - 1]
+    assert fixedpoint.allocate([], 10 ** 40, 3) == []
+
+
+# Approve
+def test_rewards_resume_from_stake_snapshot(short_program_with_reward_30min, django_user_model, settings):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_2, 30, program.begin_date + timedelta(minutes=15))
+
+    tasks.calculating_rewards(catch_up=True, until=program.begin_date + timedelta(minutes=30))
+
+    boundary = program.begin_date + timedelta(minutes=30)
+    assert StakeSnapshot.load(program.id, boundary) == ({user_1.id: 10 * fixedpoint.ONE, user_2.id: 30 * fixedpoint.ONE}, 40 * fixedpoint.ONE)
+
+    # The history before the boundary is no longer read
+    settings.STAKE_SNAPSHOT_RETENTION = timedelta(0)
+    Transaction.objects.filter(program=program, created_at__lt=program.begin_date).update(status=Transaction.Status.FAILED)
+    tasks.calculating_rewards(catch_up=True, until=program.begin_date + timedelta(hours=1))
+
+    # 720 * 15 / 60 + 720 * 15 / 60 * 10 / 40 + 720 * 30 / 60 * 10 / 40
+    assert user_rewards(program, user_1) == 180 + 45 + 90
+    assert StakeSnapshot.load(program.id, program.begin_date + timedelta(hours=1)) == ({user_1.id: 10 * fixedpoint.ONE, user_2.id: 30 * fixedpoint.ONE}, 40 * fixedpoint.ONE)
+    # Only the latest boundary is kept without a retention window
+    assert StakeSnapshot.load(program.id, boundary) is None
+
+
+# Approve
+def test_active_stakers(program, django_user_model):
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    wallet_1 = Wallet.objects.create(type=Wallet.Type.DEPOSIT, balance=10, program=program, user=user_1)
+    Wallet.objects.create(type=Wallet.Type.DEPOSIT, balance=0, program=program, user=user_2)
+    Wallet.objects.create(type=Wallet.Type.REWARD, balance=5, program=program, user=user_2)
+
+    assert list(Wallet.active_stakers(program.id)) == [wallet_1]
+    assert program.participants == 1
+    # A stake is not successful yet when its balance commits, the backfill counts its active wallet
+    create_success_transaction(program, user_2, 10, program.begin_date)
+    ProgramStats.objects.filter(program=program).delete()
+    assert ProgramStats.refresh(program.id).max_participants == 2
+
+
+# Approve
+def test_stake_applies_stats_deltas(program, monkeypatch):
+    ProgramStats.refresh(program.id)
+    ProgramStats.apply_stake(program.id, 10, participants=1, new_participant=True)
+    ProgramStats.apply_stake(program.id, -4)
+
+    stats = ProgramStats.objects.get(program=program)
+    assert (stats.total_staked, stats.participants, stats.max_participants) == (6, 1, 1)
+
+    # APY runs after commit, its failure is logged and does not reach the stake
+    monkeypatch.setattr(Program, '_apy', lambda self, staked: 1 / 0)
+    ProgramStats.refresh_apy(program.id)
+    assert ProgramStats.objects.get(program=program).total_staked == 6
+
+
+# Approve
+def test_replayed_rewards_are_not_duplicated(short_program_with_reward_30min, django_user_model):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_1, 10, program.begin_date + timedelta(minutes=15))
+
+    tasks.calculating_rewards()
+    Program.objects.filter(id=program.id).update(last_rewarded=None)
+    tasks.calculating_rewards()
+
+    assert Reward.objects.filter(program=program).count() == 2
+    assert user_rewards(program, user_1) == 360
+    assert Wallet.objects.get(program=program, user=user_1, type=Wallet.Type.REWARD).balance == 360
+    assert RewardRun.objects.filter(program=program, status=RewardRun.Status.FINISHED).count() == 2
+
+
+# Approve
+def test_interrupted_reward_run_resumes(short_program_with_reward_30min, django_user_model, monkeypatch):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    tx = create_success_transaction(program, user_2, 30, program.begin_date + timedelta(minutes=15))
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('worker died')
+
+    monkeypatch.setattr(StakeSnapshot, 'write', crash)
+    with pytest.raises(RuntimeError):
+        tasks.calculating_rewards()
+    monkeypatch.undo()
+
+    run = RewardRun.objects.get(program=program)
+    assert run.status == RewardRun.Status.RUNNING
+    assert run.cursor_transaction_id == tx.id
+    assert user_rewards(program, user_1) == 180
+
+    tasks.calculating_rewards()
+
+    run.refresh_from_db()
+    assert run.status == RewardRun.Status.FINISHED
+    assert run.iteration_index == 1
+    # 720 * 15 / 60 + 720 * 15 / 60 * 10 / 40
+    assert user_rewards(program, user_1) == 225
+    assert user_rewards(program, user_2) == 135
+    assert Reward.objects.filter(program=program).count() == 3
+
+
+# Approve
+def test_reward_run_telemetry(short_program_with_reward_30min, django_user_model):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    user_2 = django_user_model.objects.create(username="user_2", password="12345", email='q@q.q')
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+    create_success_transaction(program, user_2, 30, program.begin_date + timedelta(minutes=15))
+
+    tasks.calculating_rewards()
+
+    run = RewardRun.objects.get(program=program)
+    assert run.transactions_scanned == 1
+    assert run.wallets_considered == 1 + 2
+    assert run.rewards_written == 3
+    assert run.queries > 0
+    assert run.duration is not None
+    assert run.peak_rss > 0
+    assert run.lag == run.finished_at - (program.begin_date + timedelta(minutes=30))
+
+
+# Approve
+def test_locked_program_is_skipped(short_program_with_reward_30min, django_user_model):
+    program = short_program_with_reward_30min
+    user_1 = django_user_model.objects.create(username="user_1", password="12345")
+    create_success_transaction(program, user_1, 10, program.begin_date - timedelta(minutes=30))
+
+    # Another session holds the lock, as a run in a different worker would
+    other = connection.copy()
+    try:
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [reward_lock_key(program.id)])
+        result, = tasks.calculating_rewards(catch_up=True, program_ids=[str(program.id)])
+    finally:
+        other.close()
+
+    assert (result['skipped'], result['iterations']) == (True, 0)
+    assert not Reward.objects.filter(program=program).exists()
+
+
+# Approve
+def test_calculating_rewards_dispatch(program, monkeypatch):
+    dispatched = []
+
+    class Dispatch:
+        def __init__(self, kind, subtasks):
+            dispatched.append((kind, subtasks))
+
+        def __call__(self, callback):
+            pass
+
+        def apply_async(self):
+            pass
+
+    monkeypatch.setattr(tasks.celery, 'chord', lambda subtasks: Dispatch('chord', subtasks))
+    monkeypatch.setattr(tasks.celery, 'group', lambda subtasks: Dispatch('group', subtasks))
+    app = tasks.calculating_rewards.app
+
+    monkeypatch.setattr(app.conf, 'result_backend', 'redis://')
+    tasks.calculating_rewards.apply(kwargs={'program_ids': [str(program.id)]})
+    monkeypatch.setattr(app.conf, 'result_backend', None)
+    tasks.calculating_rewards.apply(kwargs={'program_ids': [str(program.id)]})
+
+    assert [kind for kind, _ in dispatched] == ['chord', 'group']
+    assert all(subtasks[0].args[0] == str(program.id) for _, subtasks in dispatched)
@@ -0,0 +1,98 @@
+import decimal
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from blockcommon.latency import treasury_call
+from blockfunder.models import Account as FunderAccount
+from common.helpers import TreasuryAPI
+from .models import Account, TreasuryBalanceCheck
+
+__all__ = 'RateLimiter', 'fetch_treasury_balance', 'reconcile_treasury',
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 20  # Treasury requests per second
+
+
+class RateLimiter:
+    """
+    Spaces calls of all threads at least 1 / rate seconds apart
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(slot - now)
+
+
+def fetch_treasury_balance(treasury_id: int) -> decimal.Decimal:
+    with treasury_call('get_wallet'):
+        wallet = TreasuryAPI().treasury_wallet_controller().get_wallet(treasury_id)
+    return decimal.Decimal(str(wallet.balance))
+
+
+def reconcile_treasury(workers: Optional[int] = None, rate: Optional[float] = None) -> List[TreasuryBalanceCheck]:
+    """
+    Compare the balance of every Treasury wallet used by blockfarm and blockfunder accounts with the
+    sum of balances of these accounts, and store one TreasuryBalanceCheck per wallet.
+
+    Treasury wallets of users are not checked: their balance is kept by the exchange wallets, which
+    blockfarm and blockfunder only move funds from and to, and no account here holds the expected
+    amount for them. A transfer lost on the user side shows up as a mismatch of the program wallet.
+
+    Treasury requests are fanned out over a pool of `workers` threads limited to `rate` requests per
+    second (settings TREASURY_RECONCILIATION_WORKERS / TREASURY_RECONCILIATION_RATE by default).
+    Threads only talk to Treasury, all database access stays in the calling thread.
+
+    :return: saved checks
+    """
+    workers = workers or getattr(settings, 'TREASURY_RECONCILIATION_WORKERS', DEFAULT_WORKERS)
+    limiter = RateLimiter(rate or getattr(settings, 'TREASURY_RECONCILIATION_RATE', DEFAULT_RATE))
+    checked_at = timezone.now()
+
+    expected, accounts = defaultdict(decimal.Decimal), defaultdict(list)
+    for app, model in (('blockfarm', Account), ('blockfunder', FunderAccount)):
+        for account_id, treasury_id, balance in model.objects.exclude(treasury_id=None).values_list('id', 'treasury_id', 'balance').iterator():
+            expected[treasury_id] += balance
+            accounts[treasury_id].append(f'{app}:{account_id}')
+
+    def fetch(treasury_id):
+        limiter.wait()
+        return fetch_treasury_balance(treasury_id)
+
+    checks = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, treasury_id): treasury_id for treasury_id in expected}
+        for future in as_completed(futures):
+            treasury_id = futures[future]
+            check = TreasuryBalanceCheck(checked_at=checked_at, treasury_id=treasury_id, accounts=','.join(accounts[treasury_id]), expected=expected[treasury_id])
+            try:
+                check.actual = future.result()
+            except Exception as ex:
+                logger.exception(f"Treasury wallet {treasury_id} request failed")
+                check.status, check.error = TreasuryBalanceCheck.Status.ERROR, str(ex)[:512]
+            else:
+                if check.actual == check.expected:
+                    check.status = TreasuryBalanceCheck.Status.MATCH
+                else:
+                    logger.error(f"Treasury wallet {treasury_id}: expected {check.expected}, actual {check.actual}")
+                    check.status = TreasuryBalanceCheck.Status.MISMATCH
+            checks.append(check)
+
+    TreasuryBalanceCheck.objects.bulk_create(checks)
+    return checks
@@ -12,6 +12,7 @@ urlpatterns = [
     path('reward/', ListRewards.as_view(), name='list-reward'),
     path('transaction/', ListTransaction.as_view(), name='list-transaction'),
     path('claim_reward/', ListClaimReward.as_view(), name='list-claim-reward'),
+    path('metrics/', Metrics.as_view(), name='metrics'),
 
 ]
 
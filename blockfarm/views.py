@@ -1,12 +1,20 @@
+import hmac
+
 import django_filters
+from django.conf import settings
 from django.db.models import Sum, DecimalField
 from django.db.models.functions import Coalesce
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils import timezone
+from django.views import View
 from rest_framework import generics, permissions
 from blockfarm.serializers import *
 from blockfarm.models import *
+from blockfarm.metrics import cached_metrics
+from blockcommon.response_cache import ProgramResponseCacheMixin
 from common.paginator import DRFCursorPagination
 
-__all__ = 'ListCreateTransaction', 'ListTransaction', 'ListCreateClaimReward', 'ListClaimReward', 'ListOfPrograms', 'ListRewardsByProgram', 'ListRewards', 'GetProgramById', 'GetRewardStatusByUserAndProgram'
+__all__ = 'ListCreateTransaction', 'ListTransaction', 'ListCreateClaimReward', 'ListClaimReward', 'ListOfPrograms', 'ListRewardsByProgram', 'ListRewards', 'GetProgramById', 'GetRewardStatusByUserAndProgram', 'Metrics'
 
 
 class TransactionPagination(DRFCursorPagination):
@@ -154,15 +162,16 @@ class ListClaimReward(generics.ListCreateAPIView):
         return super().get_queryset().filter(wallet__user=self.request.user)
 
 
-class ListOfPrograms(generics.ListAPIView):
+class ListOfPrograms(ProgramResponseCacheMixin, generics.ListAPIView):
     """
     Info about all BlockFarm programs
     program/
     """
 
+    cache_endpoint = 'list'
     serializer_class = ProgramSerializer
     permission_classes = [permissions.AllowAny]
-    queryset = Program.objects.select_related('transaction_currency', 'reward_currency')
+    queryset = Program.with_stats()
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -237,15 +246,16 @@ class ListRewards(generics.ListAPIView):
         return queryset.filter(user=self.request.user)
 
 
-class GetProgramById(generics.RetrieveAPIView):
+class GetProgramById(ProgramResponseCacheMixin, generics.RetrieveAPIView):
     """
     Info about program by UUID
     program/<uuid:program_id>/
     """
 
+    cache_endpoint = 'detail'
     serializer_class = ProgramSerializer
     permission_classes = [permissions.AllowAny]
-    queryset = Program.objects.select_related('transaction_currency', 'reward_currency')
+    queryset = Program.with_stats()
     lookup_url_kwarg = 'program_id'
 
     def get_queryset(self):
@@ -284,8 +294,29 @@ class GetRewardStatusByUserAndProgram(generics.RetrieveAPIView):
                                                    status=ClaimReward.Status.SUCCESS).aggregate(
             amount=Coalesce(Sum('amount'), 0, output_field=DecimalField()))['amount']
 
+        current_rewarded = reward_wallet.balance
+        if program.reward_engine == Program.RewardEngine.ACCUMULATOR:
+            current_rewarded += stack_wallet.pending_reward(program.accrued_reward_per_token(timezone.now()))
+
         return {
             'current_stacked': stack_wallet.balance,
-            'current_rewarded': reward_wallet.balance,
+            'current_rewarded': current_rewarded,
             'total_claimed': total_claimed,
         }
+
+
+class Metrics(View):
+    """
+    Operational metrics in Prometheus text format
+    metrics/
+
+    Available to staff users and to scrapers sending `Authorization: Bearer <settings.METRICS_TOKEN>`.
+    A plain Django view, so the scraper token never reaches DRF authentication.
+    """
+
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        authorized = bool(token) and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {token}'.encode())
+        if not authorized and not request.user.is_staff:
+            return HttpResponseForbidden()
+        return HttpResponse(cached_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
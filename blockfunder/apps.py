@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.apps import AppConfig
 
 
@@ -10,6 +10,19 @@ class BlockfunderConfig(AppConfig):
         import blockfunder.signals
         from blockfunder.models import Transaction
         from blockfunder.models import Program
+        from blockfunder.models import Account
+        from blockfunder.models import ProgramLink
+        from blockfunder.models import LicenseAgreement
 
         post_save.connect(blockfunder.signals.push_transaction, sender=Transaction, dispatch_uid='push_transaction')
         post_save.connect(blockfunder.signals.create_program_accounts, sender=Program, dispatch_uid='create_program_accounts')
+
+        # Cached responses of the public program endpoints
+        for signal in (post_save, post_delete):
+            signal.connect(blockfunder.signals.invalidate_program, sender=Program, dispatch_uid='invalidate_program')
+            signal.connect(blockfunder.signals.invalidate_program_of_account, sender=Account, dispatch_uid='invalidate_program_of_account')
+        for sender in (ProgramLink, LicenseAgreement):
+            post_save.connect(blockfunder.signals.invalidate_programs_of, sender=sender, dispatch_uid=f'invalidate_programs_of_{sender.__name__}')
+            pre_delete.connect(blockfunder.signals.invalidate_programs_of, sender=sender, dispatch_uid=f'invalidate_programs_of_{sender.__name__}')
+        for through in (Program.links.through, Program.agreement.through):
+            m2m_changed.connect(blockfunder.signals.invalidate_program_relations, sender=through, dispatch_uid=f'invalidate_program_relations_{through.__name__}')
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.23 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfunder', '0012_transaction_rate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(status__in=[0, 1]), fields=['status'], name='blockfunder_transaction_open'),
+        ),
+    ]
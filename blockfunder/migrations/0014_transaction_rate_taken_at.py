@@ -0,0 +1,18 @@
+# Generated by Django 2.2.23 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockfunder', '0013_transaction_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='rate_taken_at',
+            field=models.DateTimeField(blank=True, help_text='Time of the currency rate snapshot the rate comes from, empty for a signed rate', null=True),
+        ),
+    ]
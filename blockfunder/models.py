@@ -11,6 +11,10 @@ from exchange import fields
 import uuid
 from exchange.models import MainTrader
 from affiliate.models import Payout, Profile
+from blockcommon import fixedpoint
+from blockcommon.latency import treasury_call
+from blockcommon.rates import currency_rates
+from blockcommon.response_cache import invalidate_program_responses
 
 __all__ = 'Program', 'ProgramLink', 'Account', 'Wallet', 'Transaction', 'LicenseAgreement', 'LicenseAgreementConfirmation',
 
@@ -145,6 +149,7 @@ class Transaction(models.Model):
     amount = fields.FixedDecimalField(validators=[validators.MinValueValidator(limit_value=0)])
     amount2 = fields.FixedDecimalField(validators=[validators.MinValueValidator(limit_value=0)], null=True)
     rate = fields.FixedDecimalField(null=True)
+    rate_taken_at = models.DateTimeField(null=True, blank=True, help_text="Time of the currency rate snapshot the rate comes from, empty for a signed rate")
     deposit_wallet = models.ForeignKey('Wallet', models.PROTECT, related_name='TRANSACTION_deposit_wallet')
     deposit_account = models.ForeignKey('Account', models.PROTECT, related_name='TRANSACTION_deposit_account')
     reward_wallet = models.ForeignKey('Wallet', models.PROTECT, related_name='TRANSACTION_reward_wallet')
@@ -155,14 +160,24 @@ class Transaction(models.Model):
     rewarded = models.BooleanField(default=False)
     buy_out = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Only transactions still in flight, for the metrics
+            models.Index(fields=['status'], name='blockfunder_transaction_open', condition=models.Q(status__in=[0, 1])),
+        ]
+
     def create_transaction(self):
         if self.rate:
             rate = self.rate
         else:
-            rate = self.deposit_currency.usd_rate
+            # Recorded with the transaction, so the price of the sale can be audited
+            rates = currency_rates.snapshot_for(self.deposit_currency_id)
+            rate = self.rate = rates.usd_rate(self.deposit_currency_id)
+            self.rate_taken_at = rates.taken_at
 
         Wallet.objects.select_for_update().filter(id=self.reward_wallet.id)
-        if self.reward_wallet.total_rewarded + (self.amount * rate / self.program.rate) <= self.program.hard_cap:
+        amount_to_reward = fixedpoint.mul_div(fixedpoint.to_fixed(self.amount), fixedpoint.to_fixed(rate), fixedpoint.to_fixed(self.program.rate))
+        if fixedpoint.to_fixed(self.reward_wallet.total_rewarded) + amount_to_reward <= fixedpoint.to_fixed(self.program.hard_cap):
 
             def create_affiliate_payout(tx: Transaction):
                 try:
@@ -178,22 +193,21 @@ class Transaction(models.Model):
                     pass
 
             try:
-                amount_to_reward = self.amount * rate / self.program.rate
-
                 kwargs = {
                     "amount1": str(self.amount),
-                    "amount2": str(amount_to_reward)
+                    "amount2": str(fixedpoint.to_decimal(amount_to_reward))
                 }
 
                 if self.buy_out:
                     kwargs["buyout"] = True
 
-                response = TreasuryAPI().treasury_wallet_controller().swap(self.deposit_wallet.get_wallet(self.deposit_currency.code).id,
-                                                                           self.reward_account.treasury_id,
-                                                                           self.reward_wallet.get_wallet(self.program.reward_currency.code).id,
-                                                                           self.deposit_account.treasury_id,
-                                                                           **kwargs
-                                                                           )
+                with treasury_call('swap'):
+                    response = TreasuryAPI().treasury_wallet_controller().swap(self.deposit_wallet.get_wallet(self.deposit_currency.code).id,
+                                                                               self.reward_account.treasury_id,
+                                                                               self.reward_wallet.get_wallet(self.program.reward_currency.code).id,
+                                                                               self.deposit_account.treasury_id,
+                                                                               **kwargs
+                                                                               )
                 with transaction.atomic():
                     Account.objects.filter(id=self.deposit_account_id).update(balance=F("balance") + response.amount1)
                     Wallet.objects.filter(id=self.deposit_wallet_id).update(balance=F("balance") - response.amount1)
@@ -203,6 +217,8 @@ class Transaction(models.Model):
                     self.amount2 = response.amount2
                     self.status = Transaction.Status.SUCCESS
                     self.save()
+                # Account balances are updated without signals
+                invalidate_program_responses('blockfunder', self.program_id)
 
                 try:
                     if self.program.affiliate:
@@ -11,6 +11,7 @@ from rest_framework import serializers
 from exchange.models import Currency
 from django.conf import settings
 from blockfunder.models import *
+from blockcommon.rates import currency_rates
 import decimal
 
 __all__ = 'ProgramSerializer', 'TransactionSerializer', 'LicenseAgreementSerializer',
@@ -53,6 +54,7 @@ class UserSaleStats(serializers.Serializer):
     total_amount_usd = FixedDecimalField(min_value=0, read_only=True)
     total_amount2 = FixedDecimalField(min_value=0, read_only=True)
     total_amount2_usd = FixedDecimalField(min_value=0, read_only=True)
+    rates_taken_at = serializers.DateTimeField(read_only=True)
 
     def create(self, validated_data):
         raise NotImplementedError('`create()` must be implemented.')
@@ -108,9 +110,11 @@ class ProgramSerializer(serializers.ModelSerializer):
         user: User
         user = self.context['request'].user
         if user.is_authenticated:
+            deposits = list(instance.transaction_set.filter(user=self.context['request'].user).values('deposit_currency').annotate(amount=Sum('amount')).order_by())
+            rates = currency_rates.snapshot_for(*(deposit['deposit_currency'] for deposit in deposits))
             total_amount_usd = decimal.Decimal(0)
-            for transaction in instance.transaction_set.filter(user=self.context['request'].user).values('deposit_currency').annotate(amount=Sum('amount')).order_by():
-                total_amount_usd += transaction['amount'] * Currency.objects.get(pk=transaction['deposit_currency']).usd_rate
+            for deposit in deposits:
+                total_amount_usd += deposit['amount'] * rates.usd_rate(deposit['deposit_currency'])
             total_amount2 = instance.transaction_set.filter(user=self.context['request'].user).aggregate(
                 amount=Coalesce(Sum('amount2'), 0, output_field=DecimalField()))['amount']
             total_amount2_usd = total_amount2 * instance.rate
@@ -119,7 +123,8 @@ class ProgramSerializer(serializers.ModelSerializer):
                     'total_txs': instance.transaction_set.filter(user=self.context['request'].user).count(),
                     'total_amount_usd': total_amount_usd,
                     'total_amount2': total_amount2,
-                    'total_amount2_usd': total_amount2_usd
+                    'total_amount2_usd': total_amount2_usd,
+                    'rates_taken_at': rates.taken_at,
                 }
             )
             return user_sale_stats.data
@@ -136,6 +141,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     amount = FixedDecimalField(min_value=0, required=True)
     amount2 = FixedDecimalField(min_value=0, read_only=True)
     rate = FixedDecimalField(min_value=0, read_only=True)
+    rate_taken_at = serializers.DateTimeField(read_only=True)
     signed_rate = SignedRateSerializer(write_only=True, required=False)
     reward_currency = CurrencySerializer(read_only=True, source='program.reward_currency')
     created_at = serializers.DateTimeField(read_only=True)
@@ -144,7 +150,7 @@ class TransactionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Transaction
-        fields = ['id', 'deposit_currency', 'currency_code', 'reward_currency', 'created_at', 'status', 'program', 'user', 'email', 'amount', 'amount2', 'rate', 'signed_rate']
+        fields = ['id', 'deposit_currency', 'currency_code', 'reward_currency', 'created_at', 'status', 'program', 'user', 'email', 'amount', 'amount2', 'rate', 'rate_taken_at', 'signed_rate']
 
     def get_email(self, obj):
         return mask_email(obj.user.email)
@@ -1,4 +1,5 @@
 from blockfunder.models import Transaction, Program
+from blockcommon.response_cache import invalidate_program_responses, invalidate_related_program_responses
 from django.db import DatabaseError
 import logging
 
@@ -18,3 +19,23 @@ def push_transaction(sender, instance: Transaction, created, **kwargs):
 
 def create_program_accounts(sender, instance: Program, created, **kwargs):
     instance.create_account()
+
+
+def invalidate_program(sender, instance: Program, **kwargs):
+    invalidate_program_responses('blockfunder', instance.pk)
+
+
+def invalidate_program_of_account(sender, instance, **kwargs):
+    invalidate_program_responses('blockfunder', instance.program_id)
+
+
+def invalidate_programs_of(sender, instance, **kwargs):
+    """
+    ProgramLink or LicenseAgreement changed
+    """
+    for program_id in instance.program_set.values_list('id', flat=True):
+        invalidate_program_responses('blockfunder', program_id)
+
+
+def invalidate_program_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    invalidate_related_program_responses('blockfunder', instance, action, reverse, pk_set)
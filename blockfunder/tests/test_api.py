@@ -1,5 +1,6 @@
 import logging
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework import status
 from blockfunder.models import *
 import decimal
@@ -53,3 +54,40 @@ def test_create_transaction__false_program_buy_enable(verified_client, verified_
     }
     response = verified_client.post(f'/dapi/blockfunder/program/{program.id}/transaction/', request, format='json')
     assert response.status_code == status.HTTP_403_FORBIDDEN, response.data
+
+
+def listed_program(response, program):
+    programs = response.data['results'] if isinstance(response.data, dict) else response.data
+    return next(item for item in programs if item['id'] == str(program.id))
+
+
+# Approve
+def test_program_response_cache_anonymous_only(client, verified_client, verified_user, program):
+    cache.clear()
+    name = client.get(f'/dapi/blockfunder/program/{program.id}/').data['name']
+
+    # Updated without signals: anonymous requests get the cached response, users a fresh one
+    Program.objects.filter(id=program.id).update(name='Renamed')
+    assert client.get(f'/dapi/blockfunder/program/{program.id}/').data['name'] == name
+    response = verified_client.get(f'/dapi/blockfunder/program/{program.id}/')
+    assert response.status_code == status.HTTP_200_OK, response.data
+    assert response.data['name'] == 'Renamed'
+    # A response of a user, with its sale stats, is not cached for anonymous requests
+    assert client.get(f'/dapi/blockfunder/program/{program.id}/').data['name'] == name
+
+
+# Approve
+def test_program_list_cache_invalidated_by_relations(client, program):
+    cache.clear()
+    assert listed_program(client.get('/dapi/blockfunder/program/'), program)['links'] == []
+
+    link = ProgramLink.objects.create(name='Site', hyperlink='https://example.com')
+    program.links.add(link)
+    assert [item['name'] for item in listed_program(client.get('/dapi/blockfunder/program/'), program)['links']] == ['Site']
+
+    # Changed from the agreement side
+    agreement = LicenseAgreement.objects.create(name='Terms', description='Terms of sale')
+    agreement.program_set.add(program)
+    assert [item['name'] for item in listed_program(client.get('/dapi/blockfunder/program/'), program)['agreement']] == ['Terms']
+    agreement.program_set.clear()
+    assert listed_program(client.get('/dapi/blockfunder/program/'), program)['agreement'] == []
@@ -2,6 +2,7 @@ from blockfunder.models import Account, Wallet, Transaction
 from django.contrib.auth.models import User
 from exchange.models import MainTrader
 from django.conf import settings
+import decimal
 import logging
 
 
@@ -335,3 +336,59 @@ def test_create__transaction_normal_2_transactions(client, verified_user, progra
     assert deposit_wallet_before_2_transaction.balance == deposit_wallet_after_2_transaction.balance + 9, 'Unexpected value in deposit wallet'
     assert reward_account_before_2_transaction.balance == reward_account_after_2_transaction.balance + 9, 'Unexpected value in reward account'
     assert reward_wallet_before_2_transaction.balance + 9 == reward_wallet_after_2_transaction.balance, 'Unexpected value in reward wallet'
+
+
+def create_sale_transaction(program, user, amount, total_rewarded=0):
+    deposit_account, created = Account.objects.get_or_create(type=Account.Type.DEPOSIT, program=program, currency_id=1)
+    Account.objects.filter(id=deposit_account.id).update(treasury_id=1, balance=20)
+    reward_account, created = Account.objects.get_or_create(type=Account.Type.REWARD, program=program, currency_id=2)
+    Account.objects.filter(id=reward_account.id).update(treasury_id=1, balance=1000000)
+    deposit_wallet, created = Wallet.objects.get_or_create(type=Wallet.Type.DEPOSIT, user=user, program=program)
+    Wallet.objects.filter(id=deposit_wallet.id).update(balance=1000000000)
+    reward_wallet, created = Wallet.objects.get_or_create(type=Wallet.Type.REWARD, user=user, program=program)
+    Wallet.objects.filter(id=reward_wallet.id).update(total_rewarded=total_rewarded)
+    return Transaction.objects.create(program=program, amount=amount, deposit_account=deposit_account, reward_account=reward_account, deposit_currency_id=1,
+                                      deposit_wallet=Wallet.objects.get(id=deposit_wallet.id), reward_wallet=Wallet.objects.get(id=reward_wallet.id), user=user)
+
+
+def expect_wallets(httpserver, verified_user):
+    trader_id = MainTrader.objects.get(user__email=verified_user).trader_id
+    for code in ('DGTX', 'BTC'):
+        httpserver.expect_request("/wallets", query_string=f"traderId={trader_id}&currencyCode={code}&kind=DEPOSIT").respond_with_json([{"id": 100, "traderId": trader_id, "currency": {"id": 1, "currencyPairId": 0, "name": "Digitex", "code": "DGTX", "scale": 4, "sellPrice": "1.00000000000000000000", "buyPrice": "1.00000000000000000000"}, "balance": "10000.00000000000000000000", "blockchainAddress": "0x0A190CE3Ba33e0D2c999f35E58AF1202b064fe2F"}])
+    settings.TREASURY_URL = httpserver.url_for("")[:-1]
+
+
+# Approve
+def test_create_transaction__reward_reaches_hard_cap(client, verified_user, program, currency_pair_log, httpserver):
+    expect_wallets(httpserver, verified_user)
+    httpserver.expect_request("/wallets/100/swap", query_string="wallet2=1&wallet3=100&wallet4=1&amount1=10&amount2=10.000000000000000000").respond_with_json({'amount1': 10, 'amount2': 10}, status=200)
+
+    # 90 rewarded before, 10 more end exactly at the hard cap of 100
+    transaction = create_sale_transaction(program, User.objects.get(email=verified_user), 10, total_rewarded=90)
+
+    assert transaction.status == Transaction.Status.SUCCESS
+    assert Wallet.objects.get(id=transaction.reward_wallet_id).total_rewarded == 100
+
+
+# Approve
+def test_create_transaction__reward_above_hard_cap_by_one_unit(client, verified_user, program, currency_pair_log, httpserver):
+    # No Treasury request is expected, the transaction fails before the swap
+    transaction = create_sale_transaction(program, User.objects.get(email=verified_user), 10, total_rewarded=decimal.Decimal('90.000000000000000001'))
+
+    assert transaction.status == Transaction.Status.FAILED
+    assert Wallet.objects.get(id=transaction.reward_wallet_id).total_rewarded == decimal.Decimal('90.000000000000000001')
+    assert Wallet.objects.get(id=transaction.deposit_wallet_id).balance == 1000000000
+
+
+# Approve
+def test_create_transaction__amount2_is_truncated(client, verified_user, program, currency_pair_log, httpserver):
+    program.rate = 3
+    program.save()
+    expect_wallets(httpserver, verified_user)
+    # 10 * 10 / 3, the 19th digit is dropped instead of rounded up
+    httpserver.expect_request("/wallets/100/swap", query_string="wallet2=1&wallet3=100&wallet4=1&amount1=10&amount2=33.333333333333333333").respond_with_json({'amount1': 10, 'amount2': '33.333333333333333333'}, status=200)
+
+    transaction = create_sale_transaction(program, User.objects.get(email=verified_user), 10)
+
+    assert transaction.status == Transaction.Status.SUCCESS
+    assert Wallet.objects.get(id=transaction.reward_wallet_id).total_rewarded == decimal.Decimal('33.333333333333333333')
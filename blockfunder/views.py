@@ -5,6 +5,7 @@ from rest_framework import generics, permissions
 from blockfunder.pagintations import *
 from blockfunder.serializers import *
 from blockfunder.models import *
+from blockcommon.response_cache import ProgramResponseCacheMixin
 
 __all__ = 'ListOfPrograms',  'GetProgramById', 'ListCreateTransaction', 'ListAllTransactionByProgram', 'AgreementView', 'ListAllTransaction', 'ListTransaction',
 
@@ -35,12 +36,15 @@ class TransactionFilter(django_filters.FilterSet):
         fields = ['created_at_to', 'created_at_from', ]
 
 
-class ListOfPrograms(generics.ListAPIView):
+class ListOfPrograms(ProgramResponseCacheMixin, generics.ListAPIView):
     """
     Info about all BlockFunder programs
     program/
     """
 
+    # user_sale_stats and agreement confirmations belong to the requesting user
+    cache_endpoint = 'list'
+    cache_authenticated = False
     serializer_class = ProgramSerializer
     permission_classes = [permissions.AllowAny]
     queryset = Program.objects.prefetch_related('deposit_currency', 'reward_currency')
@@ -53,12 +57,14 @@ class ListOfPrograms(generics.ListAPIView):
             return queryset.filter(is_enable=True, is_visible=True)
 
 
-class GetProgramById(generics.RetrieveAPIView):
+class GetProgramById(ProgramResponseCacheMixin, generics.RetrieveAPIView):
     """
     Info about program by UUID
     program/<uuid:program_id>/
     """
 
+    cache_endpoint = 'detail'
+    cache_authenticated = False
     serializer_class = ProgramSerializer
     permission_classes = [permissions.AllowAny]
     queryset = Program.objects.prefetch_related('deposit_currency', 'reward_currency')